@@ -1,5 +1,7 @@
 from langchain.tools import Tool
 from streamlit_Csv import CSVHandler, parse_kv_string
+from metrics import timed
+from responsecache import writing_tool
 
 
 SYSTEM_PROMPT = """You are an AI CSV assistant that helps users manage their CSV data.
@@ -7,7 +9,8 @@ You can perform the following operations:
 1. View information about the CSV including columns and a preview
 2. Remove rows or columns
 3. Add new rows or columns
-4. Set values for specific cells or entire rows"""
+4. Set values for specific cells or entire rows
+5. Undo the most recent edit"""
 
 def create_tools(csv_handler):
     tools = [
@@ -56,6 +59,19 @@ def create_tools(csv_handler):
             )(*input_str.split(":", 1)),
             description="Sets an entire row. Input: 'row_index/first/last: key=value, key2=value2'. Row can be numeric or 'first'/'last'."
         ),
+
+        Tool.from_function(
+            name="Undo",
+            func=lambda _: csv_handler.undo(),
+            description="Reverts the most recent edit. Input is ignored."
+        ),
     ]
+    # Each call is recorded as a "tool" span for the timings expander, and
+    # every tool but GetCSVInfo edits, which keeps the turn out of the
+    # response cache.
+    for tool in tools:
+        tool.func = timed("tool", tool.name, tool.func)
+        if tool.name != "GetCSVInfo":
+            tool.func = writing_tool(csv_handler, tool.func)
     
     return tools
\ No newline at end of file
@@ -1,10 +1,22 @@
 import streamlit as st
 import pandas as pd
+import hashlib
+import math
 import os
+import re
+import shutil
+import time
+import uuid
 from langchain.agents import initialize_agent
 from langchain.agents.agent_types import AgentType
 from langchain_google_genai import ChatGoogleGenerativeAI
 from streamlit_Csv import CSVHandler, parse_kv_string
+# streamlit_Csv puts the repo root on sys.path.
+from fastpath import run_command
+from metrics import MetricsCallback, trace_turn
+from responsecache import ResponseCache, data_version, tracking_writes
+from tools import create_workspace_tools
+from workspace import Workspace
 import Streamlit_Tools as tools_module
 from Streamlit_Tools import SYSTEM_PROMPT
 
@@ -15,31 +27,149 @@ if "messages" not in st.session_state:
 if "api_key" not in st.session_state:
     st.session_state.api_key = ""
 
-temp_dir = os.path.join(os.getcwd(), "temp")
-os.makedirs(temp_dir, exist_ok=True)
-temp_csv_path = os.path.join(temp_dir, "working_csv.csv")
-empty_df = pd.DataFrame()
+# Session copies untouched for this long are deleted when a new session starts.
+TEMP_TTL = float(os.getenv("CSV_TEMP_TTL", 24 * 3600))
+temp_root = os.path.join(os.getcwd(), "temp")
 
-if "csv_handler" not in st.session_state:
-    st.session_state.csv_handler = CSVHandler(temp_csv_path)
-    st.session_state.csv_handler.df = empty_df
+def remove_stale_sessions(root, ttl):
+    # Returns the ids of the sessions removed.
+    if not os.path.isdir(root):
+        return []
+    cutoff = time.time() - ttl
+    removed = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            stale = os.path.isdir(path) and os.path.getmtime(path) < cutoff
+        except OSError:
+            continue
+        if stale:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+    return removed
+
+@st.cache_resource
+def shared_workspace():
+    # One per server process: the CSVs of every browser session share its
+    # memory budget, and the least recently used frames are dropped (to be
+    # reloaded from their Feather copy) when it's exceeded.
+    return Workspace(root=temp_root, open_handler=CSVHandler)
+
+workspace = shared_workspace()
+
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    for stale_id in remove_stale_sessions(temp_root, TEMP_TTL):
+        workspace.drop_session(stale_id)
+
+# Every browser session works on its own copies so users don't overwrite
+# each other. The session stands in for the active CSV's handler.
+session = workspace.session(st.session_state.session_id)
+# Each rerun marks the session as in use, so open sessions aren't removed.
+os.utime(session.directory)
+
+def has_data():
+    return session.active_name is not None and not session.df.empty
+
+def data_state():
+    # Changes when the active CSV or its data does.
+    return (session.active_name, session.version) if has_data() else None
+
+if "response_cache" not in st.session_state:
+    # Answers to read-only questions, per data version.
+    st.session_state.response_cache = ResponseCache()
 
 if "last_processed_file_id" not in st.session_state:
     st.session_state.last_processed_file_id = None
 
-def create_agent_tools():
-    st.session_state.csv_handler._load_csv()
-    tools = tools_module.create_tools(st.session_state.csv_handler)
-    return tools
-
 def create_agent():
-    if not st.session_state.csv_handler.df.empty and st.session_state.api_key:
+    # The LLM client, tools and agent are built once and reused across
+    # reruns until the API key or the handler they are bound to changes.
+    if not has_data() or not st.session_state.api_key:
+        return None
+    agent_key = (st.session_state.api_key, id(session))
+    if st.session_state.get("agent_key") != agent_key:
         llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=st.session_state.api_key)
-        agent_tools = create_agent_tools()
-        agent = initialize_agent(tools=agent_tools, llm=llm, agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, verbose=True,
+        agent_tools = tools_module.create_tools(session) + create_workspace_tools(session)
+        st.session_state.agent = initialize_agent(tools=agent_tools, llm=llm, agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, verbose=True,
             agent_kwargs={"system_message": SYSTEM_PROMPT})
-        return agent
-    return None
+        st.session_state.agent_key = agent_key
+    return st.session_state.agent
+
+PAGE_SIZES = [25, 50, 100, 250]
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+def ingest_upload(uploaded_file, dest_path):
+    # One pass over the upload: copy it to disk in chunks while hashing it
+    # and counting rows (newlines outside quoted fields). Returns the digest
+    # and row count, or (digest, None) when this exact content is what the
+    # handler already holds unchanged, in which case nothing is replaced.
+    digest = hashlib.sha256()
+    rows = 0
+    in_quotes = False
+    last_byte = b"\n"
+    tmp_path = dest_path + ".upload"
+    uploaded_file.seek(0)
+    with open(tmp_path, "wb") as out:
+        while chunk := uploaded_file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            out.write(chunk)
+            if in_quotes or b'"' in chunk:
+                lines = chunk.split(b"\n")
+                for line in lines[:-1]:
+                    in_quotes ^= line.count(b'"') % 2 == 1
+                    rows += not in_quotes
+                in_quotes ^= lines[-1].count(b'"') % 2 == 1
+            else:
+                rows += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+    digest = digest.hexdigest()
+
+    ingested = st.session_state.setdefault("ingested", {})
+    if dest_path in session.paths.values() and os.path.exists(dest_path) and \
+            ingested.get(dest_path) == (digest, workspace.handler(dest_path).version):
+        os.remove(tmp_path)
+        return digest, None
+    os.replace(tmp_path, dest_path)
+    # An unterminated last line is still a row; the header is not.
+    rows += last_byte != b"\n"
+    return digest, max(rows - 1, 0)
+
+def highlight_changes(page, start):
+    # Styles only the cells the last change touched that fall on this page.
+    changed = session.last_changed
+    rows, columns = changed["rows"], changed["columns"]
+    if rows == [] or columns == []:
+        return page
+    on_page = range(start, start + len(page)) if rows is None else [r for r in rows if start <= r < start + len(page)]
+    subset_rows = [page.index[r - start] for r in on_page]
+    subset_cols = list(page.columns) if columns is None else [c for c in columns if c in page.columns]
+    if not subset_rows or not subset_cols:
+        return page
+    return page.style.set_properties(subset=(subset_rows, subset_cols), **{"background-color": "#fff3b0"})
+
+def show_csv_page():
+    # Sends only the visible page to the browser. Slices are cached per
+    # handler version, so reruns that didn't change the data reuse them.
+    handler = session.active
+    total = len(handler.df)
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, key="grid_page_size")
+    pages = max(1, math.ceil(total / page_size))
+    if st.session_state.get("grid_page", 1) > pages:
+        st.session_state.grid_page = pages
+    page_number = st.number_input("Page", min_value=1, max_value=pages, step=1, key="grid_page")
+    highlight = st.checkbox("Highlight last change", value=True, key="grid_highlight")
+
+    start = (page_number - 1) * page_size
+    cache_key = (handler.data_version, start, page_size)
+    page_cache = st.session_state.setdefault("grid_page_cache", {})
+    if cache_key not in page_cache:
+        page_cache.clear()
+        page_cache[cache_key] = handler.df.iloc[start:start + page_size]
+    page = page_cache[cache_key]
+
+    st.caption(f"Rows {start + 1}-{start + len(page)} of {total}")
+    st.dataframe(highlight_changes(page, start) if highlight else page)
 
 with st.sidebar:
     st.title("CSV Agent")
@@ -55,55 +185,92 @@ with st.sidebar:
             process_new_upload = True
     
     if process_new_upload:
-        if os.path.exists(temp_csv_path):
-            try:
-                os.remove(temp_csv_path)
-            except Exception:
-                pass
-        
-        df_upload = pd.read_csv(uploaded_file_widget)
-        st.session_state.csv_handler.df = df_upload
-        st.session_state.csv_handler.save()
+        # Each upload is its own CSV in the session, named after the file.
+        name = re.sub(r"[^A-Za-z0-9_-]+", "_", os.path.splitext(uploaded_file_widget.name)[0]) or "data"
+        dest_path = os.path.join(session.directory, name + ".csv")
+        digest, rows = ingest_upload(uploaded_file_widget, dest_path)
+        session.add(dest_path, name)
+        session.switch(name)
+        if rows is not None:
+            # The file on disk is already the upload: parse it once (which
+            # also writes the columnar cache) instead of parse, save, reload.
+            session.reload()
+            st.session_state.ingested[dest_path] = (digest, session.version)
+            workspace.rebalance()
+            st.caption(f"Ingested {rows} rows")
         st.session_state.last_processed_file_id = uploaded_file_widget.file_id
 
-    if os.path.exists(temp_csv_path):
-        st.session_state.csv_handler._load_csv() 
-    else:
-        st.session_state.csv_handler.df = pd.DataFrame()
-        st.session_state.last_processed_file_id = None 
+    if len(session.paths) > 1:
+        names = list(session.paths)
+        choice = st.selectbox("Active CSV", names, index=names.index(session.active_name))
+        if choice != session.active_name:
+            session.switch(choice)
 
     with csv_display.container():
         st.subheader("Current CSV Data")
-        if not st.session_state.csv_handler.df.empty:
-            st.dataframe(st.session_state.csv_handler.df)
+        if has_data():
+            if session.history:
+                if st.button("Undo last edit"):
+                    st.toast(session.undo())
+                    st.rerun()
+            show_csv_page()
         else:
             st.write("Please upload a CSV file.")
 
-    if not st.session_state.csv_handler.df.empty and st.session_state.api_key:
+    if has_data() and st.session_state.api_key:
         status_message.success("CSV loaded and agent ready!")
-    elif st.session_state.csv_handler.df.empty and not st.session_state.api_key:
+    elif not has_data() and not st.session_state.api_key:
         status_message.warning("Please upload a CSV file and enter your Gemini API Key")
-    elif st.session_state.csv_handler.df.empty:
+    elif not has_data():
         status_message.warning("Please upload a CSV file")
     elif not st.session_state.api_key:
         status_message.warning("Please enter your Gemini API Key")
 
 st.title("CSV Agent")
 
+def show_timings(message):
+    # Per-step breakdown of the turn that produced message, if traced.
+    if message.get("timings"):
+        with st.expander(f"Timings: {message['footer']}"):
+            st.dataframe(pd.DataFrame(message["timings"]), hide_index=True)
+
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.write(message["content"])
+        show_timings(message)
 
 if prompt := st.chat_input("How can I help with your CSV?"):
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.write(prompt)
-    
-    if st.session_state.csv_handler.df.empty or not st.session_state.api_key:
+
+    state = data_state()
+    # Simple commands run directly without an API key or model call.
+    direct = error_msg = None
+    try:
+        with trace_turn() as turn:
+            direct = run_command(session, prompt) if has_data() else None
+    except Exception as e:
+        error_msg = f"Error: {str(e)}"
+    if error_msg is not None:
+        with st.chat_message("assistant"):
+            st.error(error_msg)
+        st.session_state.messages.append({"role": "assistant", "content": error_msg})
+    elif direct is not None:
+        message = {"role": "assistant", "content": direct, "timings": turn.rows(), "footer": turn.footer()}
+        with st.chat_message("assistant"):
+            st.write(direct)
+            st.caption("⚡ Ran directly, no LLM call")
+            show_timings(message)
+        st.session_state.messages.append(message)
+        if data_state() != state:
+            workspace.rebalance()
+            st.rerun()
+    elif not has_data() or not st.session_state.api_key:
         with st.chat_message("assistant"):
-            if st.session_state.csv_handler.df.empty and not st.session_state.api_key:
+            if not has_data() and not st.session_state.api_key:
                 response = "Please upload a CSV file and enter your Gemini API Key."
-            elif st.session_state.csv_handler.df.empty:
+            elif not has_data():
                 response = "Please upload a CSV file first."
             elif not st.session_state.api_key:
                 response = "Please enter your Gemini API Key."
@@ -111,24 +278,34 @@ if prompt := st.chat_input("How can I help with your CSV?"):
                 response = "Agent is not ready. Please check your inputs."
             st.write(response)
         st.session_state.messages.append({"role": "assistant", "content": response})
+    elif (cached := st.session_state.response_cache.get(prompt, data_version(session))) is not None:
+        st.session_state.messages.append({"role": "assistant", "content": cached})
+        with st.chat_message("assistant"):
+            st.write(cached)
+            st.caption("♻️ Answered from cache, the data hasn't changed")
     else:
-        st.session_state.csv_handler._load_csv()
         agent = create_agent()
-        
+        cache_version = data_version(session)
+
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 try:
-                    st.session_state.csv_handler._load_csv()
-                    response = agent.run(prompt)
+                    # Tools edit the handler's frame and save it themselves.
+                    with trace_turn() as turn, tracking_writes() as writes:
+                        response = agent.run(prompt, callbacks=[MetricsCallback(turn)])
+                    if not writes and data_version(session) == cache_version:
+                        st.session_state.response_cache.put(prompt, cache_version, response)
+                    message = {"role": "assistant", "content": response, "timings": turn.rows(),
+                               "footer": turn.footer()}
                     st.write(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    st.session_state.csv_handler.save()
-                    st.session_state.csv_handler._load_csv()
-                    
-                    with csv_display.container():
-                        st.subheader("Current CSV Data")
-                        st.dataframe(st.session_state.csv_handler.df)
+                    show_timings(message)
+                    st.session_state.messages.append(message)
                 except Exception as e:
                     error_msg = f"Error: {str(e)}"
                     st.error(error_msg)
                     st.session_state.messages.append({"role": "assistant", "content": error_msg})
+
+        if data_state() != state:
+            # Redraw the sidebar page from the new data version.
+            workspace.rebalance()
+            st.rerun()
@@ -1,25 +1,104 @@
 import os
+import sys
+from collections import deque
 import pandas as pd
 
+# Column names are resolved with the shared index in the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from columnindex import ColumnIndex, match_column, resolve_columns
+from csvcache import load_cached, store_cache
+from csvutil import file_stamp
+from metrics import span
+from schema import coerce_scalar, dtype_name
+
+HISTORY_LIMIT = 50
+
 class CSVHandler:
     def __init__(self, csv_path):
         self.csv_path = csv_path
         self.df = pd.DataFrame()
+        # Bumped on every saved change so views can cache per version.
+        self.version = 0
+        # Rows/columns touched by the last change; None means all of them.
+        self.last_changed = {"rows": [], "columns": []}
+        # (description, restore function) for each edit, newest last. The
+        # functions hold only what the edit removed or overwrote.
+        self.history = deque(maxlen=HISTORY_LIMIT)
+        self._column_index = None
         self._load_csv()
         
     def _load_csv(self):
+        with span("parse", os.path.basename(self.csv_path)) as info:
+            # The shared Feather copy, so reruns skip re-parsing the text
+            # while the file is unchanged.
+            cached = load_cached(self.csv_path, file_stamp(self.csv_path))
+            info["source"] = "feather" if cached is not None else "csv"
+            if cached is not None:
+                self.df = cached
+            else:
+                try:
+                    self.df = pd.read_csv(self.csv_path)
+                    store_cache(self.df, self.csv_path, file_stamp(self.csv_path))
+                except:
+                    self.df = pd.DataFrame()
+            info["rows"] = len(self.df)
+
+    @property
+    def data_version(self):
+        # Key for cached answers about this data. The file's stamp tells
+        # apart handlers reopened (and counting from 0 again) after the
+        # workspace dropped them.
+        return (os.path.abspath(self.csv_path),) + (file_stamp(self.csv_path) or ()) + (self.version,)
+
+    def flush(self):
+        # Every edit is saved as it's made; for Workspace, which flushes
+        # the handlers it drops.
+        pass
+
+    def reload(self):
+        self._load_csv()
+        self.history.clear()
+        self.version += 1
+        self._changed([], [])
+
+    def undo(self, steps=1):
+        if not self.history:
+            return "Nothing to undo."
+        undone = []
+        while self.history and len(undone) < steps:
+            description, restore = self.history.pop()
+            restore()
+            undone.append(description)
+        self._changed([], [])
+        self.save()
+        return "Undid: " + "; ".join(undone)
+
+    def _restore_dtypes(self, dtypes):
         try:
-            self.df = pd.read_csv(self.csv_path)
-        except:
-            self.df = pd.DataFrame()
+            self.df = self.df.astype(dtypes)
+        except (TypeError, ValueError):
+            pass
+
+    def _changed(self, rows, columns):
+        self.last_changed = {"rows": rows, "columns": columns}
 
     def save(self):
+        self.version += 1
         try:
             os.makedirs(os.path.dirname(self.csv_path), exist_ok=True)
-            self.df.to_csv(self.csv_path, index=False)
+            with span("save", os.path.basename(self.csv_path), rows=len(self.df)) as info:
+                self.df.to_csv(self.csv_path, index=False)
+                info["bytes"] = os.path.getsize(self.csv_path)
+                store_cache(self.df, self.csv_path, file_stamp(self.csv_path))
         except:
             pass
 
+    def _columns(self):
+        # Rebuilt only when the set of columns changed.
+        if self._column_index is None or self._column_index.columns != list(self.df.columns):
+            self._column_index = ColumnIndex(self.df.columns)
+        return self._column_index
+
     def get_column_names(self):
         return list(self.df.columns)
         
@@ -27,11 +106,16 @@ class CSVHandler:
         return f"CSV has {len(self.df)} rows and columns: {', '.join(self.get_column_names())}\nPreview:\n{self.df.head(3).to_string()}"
 
     def remove_column(self, column_name: str):
-        column_match = next((col for col in self.df.columns if col.lower() == column_name.lower()), None)
-        if not column_match:
-            return f"Column '{column_name}' does not exist. Available columns: {', '.join(self.df.columns)}"
+        column_match, error = match_column(column_name, self._columns())
+        if error:
+            return error
         
+        position = self.df.columns.get_loc(column_match)
+        dropped = self.df[column_match]
+        self.history.append((f"remove column '{column_match}'",
+                             lambda: self.df.insert(position, column_match, dropped.array)))
         self.df.drop(columns=[column_match], inplace=True)
+        self._changed([], [])
         self.save()
         return f"Column '{column_match}' removed."
 
@@ -47,7 +131,12 @@ class CSVHandler:
             if index < 0 or index >= len(self.df):
                 return f"Row index {index} is out of bounds. CSV has {len(self.df)} rows."
             
+            removed = self.df.iloc[[index]]
+            def restore():
+                self.df = pd.concat([self.df.iloc[:index], removed, self.df.iloc[index:]])
+            self.history.append((f"remove row {index}", restore))
             self.df.drop(index=self.df.index[index], inplace=True)
+            self._changed([], [])
             self.save()
             return f"Row {index} removed."
         except ValueError:
@@ -64,17 +153,26 @@ class CSVHandler:
         if len(parts) > 1 and "values" in parts[1]:
             default_value = parts[1].split("=")[1].strip()
         
+        self.history.append((f"add column '{column_name}'",
+                             lambda: self.df.drop(columns=[column_name], inplace=True)))
         self.df[column_name] = default_value
+        self._changed(None, [column_name])
         self.save()
         return f"Column '{column_name}' added with default value: '{default_value}'."
 
     def add_row(self, row_dict: dict):
-        missing_cols = [col for col in row_dict if col not in self.df.columns]
-        if missing_cols:
-            return f"Columns not in CSV: {', '.join(missing_cols)}. Available columns: {', '.join(self.df.columns)}"
+        row_dict, error = resolve_columns(row_dict, self._columns())
+        if error:
+            return error
         
         new_row = {col: row_dict.get(col, "") for col in self.df.columns}
+        dtypes = self.df.dtypes.to_dict()
+        def restore():
+            self.df = self.df.iloc[:-1]
+            self._restore_dtypes(dtypes)
+        self.history.append(("add row", restore))
         self.df = pd.concat([self.df, pd.DataFrame([new_row])], ignore_index=True)
+        self._changed([len(self.df) - 1], None)
         self.save()
         return f"Row added: {new_row}"
 
@@ -85,10 +183,18 @@ class CSVHandler:
             if row_idx < 0 or row_idx >= len(self.df):
                 return f"Row index {row_idx} is out of bounds. CSV has {len(self.df)} rows."
             
-            if column_name not in self.df.columns:
-                return f"Column '{column_name}' does not exist. Available columns: {', '.join(self.df.columns)}"
+            column_name, error = match_column(column_name, self._columns())
+            if error:
+                return error
             
-            self.df.at[self.df.index[row_idx], column_name] = value
+            values, error = self._coerce({column_name: value})
+            if error:
+                return error
+
+            label = self.df.index[row_idx]
+            self._remember_cells(f"set '{column_name}' in row {row_idx}", label, [column_name])
+            self._assign(label, values)
+            self._changed([row_idx], [column_name])
             self.save()
             return f"Value set at row {row_idx}, column '{column_name}' to '{value}'."
         except ValueError:
@@ -101,18 +207,50 @@ class CSVHandler:
             if row_idx < 0 or row_idx >= len(self.df):
                 return f"Row index {row_idx} is out of bounds. CSV has {len(self.df)} rows."
             
-            missing_cols = [col for col in row_dict if col not in self.df.columns]
-            if missing_cols:
-                return f"Columns not in CSV: {', '.join(missing_cols)}. Available columns: {', '.join(self.df.columns)}"
+            row_dict, error = resolve_columns(row_dict, self._columns())
+            if error:
+                return error
             
-            for col, val in row_dict.items():
-                self.df.at[self.df.index[row_idx], col] = val
+            values, error = self._coerce(row_dict)
+            if error:
+                return error
+
+            label = self.df.index[row_idx]
+            self._remember_cells(f"set row {row_idx}", label, list(row_dict))
+            self._assign(label, values)
             
+            self._changed([row_idx], list(row_dict))
             self.save()
             return f"Row {row_spec} updated with values: {row_dict}"
         except ValueError:
             return f"Invalid row specifier: '{row_spec}'. Use a number or 'first'/'last'."
 
+    def _coerce(self, values):
+        # Text from the agent or the fast path, converted to each column's
+        # dtype as the CLI handler does; (values, error message).
+        try:
+            return {col: coerce_scalar(value, dtype_name(self.df[col]), col) for col, value in values.items()}, None
+        except ValueError as e:
+            return None, str(e)
+
+    def _assign(self, label, values):
+        for col, value in values.items():
+            try:
+                self.df.at[label, col] = value
+            except (TypeError, ValueError):
+                # A blank in an int64/bool column: widen it to the nullable dtype.
+                self.df[col] = self.df[col].astype(dtype_name(self.df[col]))
+                self.df.at[label, col] = value
+
+    def _remember_cells(self, description, label, columns):
+        old = {col: self.df.at[label, col] for col in columns}
+        dtypes = self.df.dtypes.to_dict()
+        def restore():
+            for col, val in old.items():
+                self.df.at[label, col] = val
+            self._restore_dtypes(dtypes)
+        self.history.append((description, restore))
+
 def parse_kv_string(input_str: str):
     parts = [kv.strip() for kv in input_str.split(",")]
     parsed = {}
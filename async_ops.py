@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# Handler calls block on pandas and file I/O, so the async path runs them
+# on a thread pool and leaves the event loop free for LLM calls. Reads run
+# side by side; writes to the same CSV are queued on the loop, one at a
+# time, instead of each parking a pool thread on the handler's lock.
+
+MAX_WORKERS = int(os.getenv("CSV_TOOL_WORKERS", min(8, (os.cpu_count() or 1) + 2)))
+
+_executor = None
+_write_locks = weakref.WeakKeyDictionary()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="csv-tool")
+    return _executor
+
+
+def _target(handler):
+    # A session workspace stands in for its active CSV.
+    try:
+        return getattr(handler, "active", handler)
+    except ValueError:
+        return handler
+
+
+def _write_lock(handler):
+    target = _target(handler)
+    key = os.path.abspath(target.csv_path) if hasattr(target, "csv_path") else id(target)
+    locks = _write_locks.setdefault(asyncio.get_running_loop(), {})
+    if key not in locks:
+        locks[key] = asyncio.Lock()
+    return locks[key]
+
+
+async def run_read(handler, func, *args):
+    # The streaming handler has no reader/writer lock of its own, so its
+    # reads wait for writes like another write would.
+    if not hasattr(_target(handler), "_rw"):
+        return await run_write(handler, func, *args)
+    return await _in_executor(func, *args)
+
+
+async def run_write(handler, func, *args):
+    async with _write_lock(handler):
+        return await _in_executor(func, *args)
+
+
+async def _in_executor(func, *args):
+    # Like asyncio.to_thread, the call sees the caller's context variables
+    # (e.g. the turn being traced).
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor(), context.run, func, *args)
+
@@ -0,0 +1,56 @@
+# Appends rows one add_row call at a time and prints the time per row at
+# checkpoints; with appends staged in memory and appended to the file, it
+# should stay flat as the CSV grows. Run from the repository root:
+#
+#   python benchmarks/append_rows.py --rows 100000 --mode plain
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from csvoperations import CSVHandler
+from stress_concurrency import MODES
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--checkpoints", type=int, default=10)
+    parser.add_argument("--mode", choices=sorted(MODES), default="plain")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="csv-append-")
+    csv_path = os.path.join(directory, "append.csv")
+    pd.DataFrame({"id": [0], "name": ["first"], "score": [1.5], "city": ["London"]}).to_csv(csv_path, index=False)
+    try:
+        handler = CSVHandler(csv_path, **MODES[args.mode])
+        step = max(1, args.rows // args.checkpoints)
+        started = time.perf_counter()
+        print(f"{'rows':>10} {'us/row (last step)':>20} {'total s':>10}")
+        for start in range(0, args.rows, step):
+            step_started = time.perf_counter()
+            count = min(step, args.rows - start)
+            for i in range(start, start + count):
+                handler.add_row({"id": str(i + 1), "name": f"name {i}", "score": "2.5", "city": "Paris"})
+            elapsed = time.perf_counter() - step_started
+            print(f"{start + count:>10} {elapsed / count * 1e6:>20.0f} {time.perf_counter() - started:>10.2f}")
+        merge_started = time.perf_counter()
+        rows = len(handler.df)
+        print(f"merge of staged rows: {time.perf_counter() - merge_started:.3f}s")
+        handler.flush()
+        on_disk = len(pd.read_csv(csv_path))
+        print(f"rows in memory {rows}, on disk {on_disk}")
+        if rows != on_disk:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# End-to-end latency of the README's example commands through the direct
+# command parser, and optionally through the agent for comparison
+# (needs GEMINI_API_KEY). Run from the repository root:
+#
+#   python benchmarks/fastpath_latency.py --rows 10000 --repeat 20
+#   python benchmarks/fastpath_latency.py --rows 1000 --repeat 3 --agent
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from csvoperations import CSVHandler
+from fastpath import parse_command, run_command
+
+COMMANDS = [
+    "Add a column named Salary with default value 0",
+    "Remove columns: customer id, phone 1, phone 2, email",
+    "Add a new row with Name as Alice, Age as 29",
+    "Remove row 2",
+    "Set the City value for row 1 to San Francisco",
+]
+
+
+def write_csv(csv_path, rows):
+    cities = ["London", "Paris", "Berlin", "Madrid", "Rome"]
+    pd.DataFrame({
+        "Customer Id": [f"C{i:07d}" for i in range(rows)],
+        "Name": [f"Person {i}" for i in range(rows)],
+        "Age": [20 + i % 50 for i in range(rows)],
+        "City": [cities[i % len(cities)] for i in range(rows)],
+        "Phone 1": [f"555-{i:07d}" for i in range(rows)],
+        "Phone 2": [f"556-{i:07d}" for i in range(rows)],
+        "Email": [f"person{i}@example.com" for i in range(rows)],
+    }).to_csv(csv_path, index=False)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def make_agent(handler):
+    from langchain.agents import initialize_agent
+    from langchain.agents.agent_types import AgentType
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from tools import create_tools, SYSTEM_PROMPT
+
+    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=os.environ["GEMINI_API_KEY"])
+    return initialize_agent(
+        tools=create_tools(handler),
+        llm=llm,
+        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        verbose=False,
+        agent_kwargs={"system_message": SYSTEM_PROMPT},
+    )
+
+
+def run_sequence(template, directory, use_agent):
+    # The commands change the columns, so every pass starts from a fresh copy.
+    csv_path = os.path.join(directory, "latency.csv")
+    shutil.copyfile(template, csv_path)
+    handler = CSVHandler(csv_path)
+    agent = make_agent(handler) if use_agent else None
+    timings = {}
+    for command in COMMANDS:
+        started = time.perf_counter()
+        if agent is None:
+            result = run_command(handler, command)
+            if result is None:
+                raise SystemExit(f"Not handled directly: {command!r}")
+        else:
+            agent.invoke({"input": command})
+        timings[command] = time.perf_counter() - started
+    return timings
+
+
+def report(label, runs):
+    print(f"\n{label}")
+    print(f"{'command':<55} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for command in COMMANDS:
+        samples = [run[command] * 1000 for run in runs]
+        print(f"{command:<55} {statistics.median(samples):>9.2f} {percentile(samples, 95):>9.2f} {max(samples):>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--agent", action="store_true", help="also time the same commands through the LLM agent")
+    args = parser.parse_args()
+
+    for command in COMMANDS:
+        print(f"{command!r} -> {parse_command(command)}")
+
+    directory = tempfile.mkdtemp(prefix="csv-fastpath-")
+    template = os.path.join(directory, "template.csv")
+    write_csv(template, args.rows)
+    try:
+        report(f"direct ({args.rows} rows, {args.repeat} runs)",
+               [run_sequence(template, directory, False) for _ in range(args.repeat)])
+        if args.agent:
+            if not os.environ.get("GEMINI_API_KEY"):
+                raise SystemExit("--agent needs GEMINI_API_KEY")
+            report(f"agent ({args.rows} rows, {args.repeat} runs)",
+                   [run_sequence(template, directory, True) for _ in range(args.repeat)])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# Times every CSVHandler method and every agent tool on synthetic CSVs of
+# growing size, and writes the results as JSON so two versions can be
+# compared. Tools are driven through a real ReAct agent whose LLM is a
+# local fake that replays scripted actions, so no API key is needed.
+# Each size runs in a fresh process so peak RSS belongs to that size.
+# Run from the repository root:
+#
+#   python benchmarks/handler_scaling.py --sizes 1k,10k,100k --repeat 10
+#   python benchmarks/handler_scaling.py --sizes 1M,10M --repeat 3 --mode session --output new.json --compare old.json
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from csvoperations import CSVHandler
+from stress_concurrency import MODES
+
+DTYPES = ("int", "float", "str", "cat", "date", "bool")
+QUOTING = {"minimal": csv.QUOTE_MINIMAL, "all": csv.QUOTE_ALL, "nonnumeric": csv.QUOTE_NONNUMERIC}
+CHUNK_ROWS = 500_000
+CATEGORIES = ["north", "south", "east", "west", "central", "overseas"]
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def parse_mix(text):
+    # "int=2,str=1" -> [int, int, str]; columns take types from it in turn.
+    pattern = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DTYPES:
+            raise SystemExit(f"Unknown dtype '{name}' in --mix; use {', '.join(DTYPES)}")
+        pattern += [name] * int(weight or 1)
+    return pattern
+
+
+def column_values(kind, rng, start, rows, string_width, special):
+    if kind == "int":
+        return rng.integers(0, 1_000_000, rows)
+    if kind == "float":
+        return np.round(rng.random(rows) * 1000, 3)
+    if kind == "cat":
+        return np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), rows)]
+    if kind == "date":
+        days = rng.integers(0, 3650, rows)
+        return (np.datetime64("2015-01-01") + days).astype(str)
+    if kind == "bool":
+        return np.where(rng.random(rows) < 0.5, "true", "false")
+    # Random text of a fixed width; with special characters some fields
+    # need quoting.
+    alphabet = np.frombuffer(b"abcdefghijklmnopqrstuvwxyz" + (b', "' if special else b""), dtype=np.uint8)
+    letters = alphabet[rng.integers(0, len(alphabet), (rows, string_width))]
+    text = letters.view(f"S{string_width}").ravel().astype(str)
+    # A row number keeps values distinct so the column stays plain text.
+    return np.char.add(text, np.arange(start, start + rows).astype(str))
+
+
+def generate_csv(csv_path, rows, columns, mix, string_width=12, quoting="minimal", special=False, seed=0):
+    rng = np.random.default_rng(seed)
+    kinds = [mix[i % len(mix)] for i in range(columns)]
+    names = [f"{kind}_{i}" for i, kind in enumerate(kinds)]
+    with open(csv_path, "w", newline="") as f:
+        for start in range(0, max(rows, 1), CHUNK_ROWS):
+            count = min(CHUNK_ROWS, rows - start)
+            chunk = pd.DataFrame({
+                name: column_values(kind, rng, start, count, string_width, special)
+                for name, kind in zip(names, kinds)
+            })
+            chunk.to_csv(f, index=False, header=start == 0, quoting=QUOTING[quoting])
+    return dict(zip(names, kinds))
+
+
+def io_counters():
+    # Bytes this process read and wrote through syscalls, where available.
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere.
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class Timer:
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, name, func, *args):
+        read_before, written_before = io_counters()
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        read_after, written_after = io_counters()
+        entry = self.samples.setdefault(name, {"seconds": [], "read": 0, "written": 0})
+        entry["seconds"].append(elapsed)
+        if read_before is not None:
+            entry["read"] += read_after - read_before
+            entry["written"] += written_after - written_before
+        return result
+
+    def summary(self):
+        return {name: summarize(entry) for name, entry in self.samples.items()}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(entry):
+    ms = [s * 1000 for s in entry["seconds"]]
+    calls = len(ms)
+    return {
+        "calls": calls,
+        "p50_ms": statistics.median(ms),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "mean_ms": statistics.fmean(ms),
+        "max_ms": max(ms),
+        "bytes_read_per_call": entry["read"] // calls,
+        "bytes_written_per_call": entry["written"] // calls,
+    }
+
+
+def pick_columns(kinds):
+    # A text column to write into and a categorical one to group by.
+    text = next((name for name, kind in kinds.items() if kind == "str"), next(iter(kinds)))
+    group = next((name for name, kind in kinds.items() if kind == "cat"), text)
+    return text, group
+
+
+def bench_methods(handler, kinds, repeat, timer):
+    text, _ = pick_columns(kinds)
+    rows = len(handler.df)
+    rng = np.random.default_rng(1)
+    timer.time("get_csv_info (cold)", handler.get_csv_info)
+    for i in range(repeat):
+        row = str(int(rng.integers(0, max(rows, 1))))
+        timer.time("get_csv_info", handler.get_csv_info)
+        timer.time("add_row", handler.add_row, {text: f"bench{i}"})
+        timer.time("remove_row", handler.remove_row, "last")
+        timer.time("set_cell", handler.set_cell, row, text, f"cell{i}")
+        timer.time("set_row", handler.set_row, row, {text: f"row{i}"})
+        timer.time("add_column", handler.add_column, f"bench_{i} with values=1")
+    for i in range(repeat):
+        timer.time("remove_column", handler.remove_column, f"bench_{i}")
+
+
+def tool_script(kinds):
+    # (tool name, input) for one pass; every pass leaves the data as it
+    # found it so passes are comparable.
+    _, group = pick_columns(kinds)
+    return [
+        ("GetCSVInfo", ""),
+        ("GetRow", "last"),
+        ("QueryCSV", f"group by {group}; agg count(*); sort by count desc; limit 5"),
+        ("AddColumn", "bench_tool with values=1"),
+        ("SetCellValue", "0, bench_tool, 2"),
+        ("SetRow", "last: bench_tool=3"),
+        ("AddRow", "bench_tool=4"),
+        ("RemoveRow", "last"),
+        ("UpdateWhere", "bench_tool = 2: bench_tool=5"),
+        ("DeleteWhere", "bench_tool = 999"),
+        ("BatchEdit", "set 0, bench_tool, 6; set 1, bench_tool, 7"),
+        ("Undo", "1"),
+        ("Redo", "1"),
+        ("ListHistory", ""),
+        ("RemoveColumn", "bench_tool"),
+    ]
+
+
+def fake_agent(handler, script):
+    from langchain.agents import initialize_agent
+    from langchain.agents.agent_types import AgentType
+    from langchain_core.language_models import FakeListLLM
+    from tools import create_tools, SYSTEM_PROMPT
+
+    # One tool call and then a final answer per turn; FakeListLLM starts
+    # over at the top of the list once it runs out.
+    responses = []
+    for name, tool_input in script:
+        responses.append(f"Thought: use {name}\nAction: {name}\nAction Input: {tool_input}")
+        responses.append("Thought: done\nFinal Answer: done")
+    return initialize_agent(
+        tools=create_tools(handler),
+        llm=FakeListLLM(responses=responses),
+        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        verbose=False,
+        agent_kwargs={"system_message": SYSTEM_PROMPT},
+    )
+
+
+def bench_tools(handler, kinds, repeat, timer):
+    script = tool_script(kinds)
+    agent = fake_agent(handler, script)
+    for _ in range(repeat):
+        for name, _ in script:
+            timer.time(name, agent.invoke, {"input": f"bench {name}"})
+
+
+def run_size(template, kinds, mode, repeat, tools, queue):
+    directory = tempfile.mkdtemp(prefix="csv-bench-")
+    csv_path = os.path.join(directory, "bench.csv")
+    shutil.copyfile(template, csv_path)
+    try:
+        timer = Timer()
+        handler = timer.time("load", CSVHandler, csv_path, **MODES[mode])
+        bench_methods(handler, kinds, repeat, timer)
+        result = {"methods": timer.summary()}
+        if tools:
+            tool_timer = Timer()
+            bench_tools(handler, kinds, repeat, tool_timer)
+            result["tools"] = tool_timer.summary()
+        flush_timer = Timer()
+        flush_timer.time("flush", handler.flush)
+        result["methods"].update(flush_timer.summary())
+        result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        queue.put(result)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def print_table(size, result):
+    print(f"\n{size} rows: file {result['file_mb']} MB, peak RSS {result['peak_rss_mb']} MB")
+    print(f"{'step':<22} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'read/call':>12} {'written/call':>13}")
+    for section in ("methods", "tools"):
+        for name, stats in result.get(section, {}).items():
+            print(f"{name:<22} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['p99_ms']:>10.2f} "
+                  f"{stats['bytes_read_per_call']:>12} {stats['bytes_written_per_call']:>13}")
+
+
+def compare(results, baseline_path):
+    # p50 ratios against an earlier run; > 1 is slower now.
+    with open(baseline_path) as f:
+        baseline = json.load(f)["sizes"]
+    print(f"\np50 compared with {baseline_path} (new / old)")
+    for size, result in results.items():
+        old = baseline.get(size)
+        if old is None:
+            continue
+        for section in ("methods", "tools"):
+            for name, stats in result.get(section, {}).items():
+                before = old.get(section, {}).get(name)
+                if before and before["p50_ms"] > 0:
+                    ratio = stats["p50_ms"] / before["p50_ms"]
+                    flag = "  <-- slower" if ratio > 1.2 else ""
+                    print(f"{size:>10} {name:<22} {ratio:>6.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1k,10k,100k", help="row counts, e.g. 1k,10k,100k,1M,10M")
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--mix", default="int,float,str,cat,date,bool", help="dtype weights, e.g. int=2,str=3,cat")
+    parser.add_argument("--string-width", type=int, default=12)
+    parser.add_argument("--quoting", choices=sorted(QUOTING), default="minimal")
+    parser.add_argument("--special", action="store_true", help="put commas, quotes and spaces in text values")
+    parser.add_argument("--mode", choices=sorted(MODES), default="plain")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--no-tools", action="store_true", help="skip the agent tool timings")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    directory = tempfile.mkdtemp(prefix="csv-bench-data-")
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    try:
+        for size in args.sizes.split(","):
+            rows = parse_size(size)
+            template = os.path.join(directory, f"{rows}.csv")
+            kinds = generate_csv(template, rows, args.columns, mix, args.string_width, args.quoting, args.special)
+            queue = context.Queue()
+            process = context.Process(target=run_size,
+                                      args=(template, kinds, args.mode, args.repeat, not args.no_tools, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            result["file_mb"] = round(os.path.getsize(template) / 1024 / 1024, 1)
+            results[str(rows)] = result
+            print_table(rows, result)
+            os.remove(template)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "args": vars(args), "sizes": results}, f, indent=1)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
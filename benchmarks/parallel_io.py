@@ -0,0 +1,88 @@
+# Loads and exports one synthetic CSV with parallel_io off and then with
+# each engine on 2, 4, 8, ... workers, and prints the time and speedup per
+# core count. Loads skip the Feather cache so every one parses the text.
+# Run from the repository root:
+#
+#   python benchmarks/parallel_io.py --rows 2M --workers 1,2,4,8,16,32
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import parallelio
+from csvoperations import CSVHandler
+from handler_scaling import generate_csv, parse_mix, parse_size
+
+
+def default_workers():
+    counts, count = [], 1
+    while count < (os.cpu_count() or 1):
+        counts.append(count)
+        count *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def time_io(csv_path, engine, workers, repeat):
+    if engine == "pyarrow":
+        import pyarrow as pa
+        pa.set_cpu_count(workers)
+    if engine is not None and workers > 1:
+        # Start the pool before the clock does.
+        parallelio.pool(workers).submit(os.getpid).result()
+    loads, saves = [], []
+    handler = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        handler = CSVHandler(csv_path, cache=False, parallel_io=engine, io_workers=workers)
+        loads.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        handler.export_csv()
+        saves.append(time.perf_counter() - started)
+    return statistics.median(loads), statistics.median(saves), handler.df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="1M", help="row count, e.g. 500k, 2M")
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--mix", default="int,float,str,cat,date,bool")
+    parser.add_argument("--special", action="store_true", help="put commas, quotes and spaces in text values")
+    parser.add_argument("--workers", default=",".join(map(str, default_workers())))
+    parser.add_argument("--engines", default=",".join(parallelio.ENGINES))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Every size takes the parallel path, so the overhead shows too.
+    parallelio.MIN_BYTES = 0
+    directory = tempfile.mkdtemp(prefix="csv-parallel-io-")
+    csv_path = os.path.join(directory, "data.csv")
+    try:
+        generate_csv(csv_path, parse_size(args.rows), args.columns, parse_mix(args.mix), special=args.special)
+        # The first load writes the schema sidecar the timed loads use.
+        CSVHandler(csv_path, cache=False)
+        print(f"{parse_size(args.rows)} rows, {os.path.getsize(csv_path) / 1024 / 1024:.1f} MB, "
+              f"{os.cpu_count()} cores")
+        load, save, expected = time_io(csv_path, None, 1, args.repeat)
+        print(f"{'engine':<10} {'workers':>7} {'load s':>8} {'x':>6} {'save s':>8} {'x':>6}")
+        print(f"{'serial':<10} {1:>7} {load:>8.3f} {1:>6.2f} {save:>8.3f} {1:>6.2f}")
+        for engine in args.engines.split(","):
+            for workers in map(int, args.workers.split(",")):
+                if workers < 2:
+                    continue
+                engine_load, engine_save, df = time_io(csv_path, engine, workers, args.repeat)
+                pd.testing.assert_frame_equal(df, expected, check_dtype=False, check_categorical=False)
+                print(f"{engine:<10} {workers:>7} {engine_load:>8.3f} {load / engine_load:>6.2f} "
+                      f"{engine_save:>8.3f} {save / engine_save:>6.2f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Hammers one CSV from many threads and processes at once and checks that no
+# update was lost and that flush() left everything in the CSV. With --mixed
+# each row is also tagged by position and a scratch row is added and removed
+# by position, and every tag must end up on its own row. Run from the
+# repository root:
+#
+#   python benchmarks/stress_concurrency.py --threads 8 --processes 4 --rows 50 --mode session
+#   python benchmarks/stress_concurrency.py --threads 4 --processes 2 --mode session --mixed
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from csvoperations import CSVHandler
+from locking import ConcurrentModificationError
+
+MODES = {
+    "plain": {},
+    "journal": {"journal": True, "compact_threshold": 25},
+    "session": {"session": True},
+    "session-journal": {"session": True, "journal": True},
+}
+
+
+def open_handler(csv_path, mode):
+    return CSVHandler(csv_path, **MODES[mode])
+
+
+def add_rows(handler, worker, rows, flush_every):
+    for i in range(rows):
+        handler.add_row({"worker": worker, "seq": str(i)})
+        if flush_every and (i + 1) % flush_every == 0:
+            handler.flush()
+    handler.flush()
+
+
+def position(handler, worker, seq):
+    df = handler.df
+    return int(np.flatnonzero((df["worker"].astype(str) == worker) & (df["seq"].astype(str) == seq))[0])
+
+
+def edit_row(handler, worker, i):
+    handler.add_row({"worker": worker, "seq": str(i), "tag": ""})
+    handler.add_row({"worker": worker, "seq": "scratch", "tag": ""})
+    # Looking a row up and editing it by position has to happen without
+    # another writer in between.
+    with handler._write_locked():
+        handler._load_csv()
+        handler.set_cell(str(position(handler, worker, str(i))), "tag", f"{worker}:{i}")
+        handler.remove_row(str(position(handler, worker, "scratch")))
+
+
+def edit_rows(handler, worker, rows, flush_every):
+    # Unsaved positional edits are discarded when another writer got in
+    # first; the rows since the last flush are then made again.
+    unsaved = []
+    for i in range(rows):
+        todo = [i]
+        while todo:
+            try:
+                for seq in todo:
+                    edit_row(handler, worker, seq)
+                unsaved += todo
+                todo = []
+                if len(unsaved) >= flush_every or i == rows - 1:
+                    handler.flush()
+                    unsaved = []
+            except ConcurrentModificationError:
+                todo = unsaved + todo
+                unsaved = []
+
+
+def run_threads(csv_path, mode, prefix, threads, rows, flush_every, shared, mixed=False):
+    handler = open_handler(csv_path, mode) if shared else None
+    work = edit_rows if mixed else add_rows
+    workers = [
+        threading.Thread(target=work, args=(handler or open_handler(csv_path, mode), f"{prefix}t{n}", rows, flush_every))
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def process_main(csv_path, mode, prefix, threads, rows, flush_every, mixed):
+    # Threads sharing a handler would move each other's rows between the
+    # lookup and the edit, so mixed edits get a handler per thread.
+    run_threads(csv_path, mode, prefix, threads, rows, flush_every, shared=not mixed, mixed=mixed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=25, help="rows appended by each thread")
+    parser.add_argument("--mode", choices=sorted(MODES), default="plain")
+    parser.add_argument("--flush-every", type=int, default=5)
+    parser.add_argument("--mixed", action="store_true", help="also edit and remove rows by position")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="csv-stress-")
+    csv_path = os.path.join(directory, "stress.csv")
+    with open(csv_path, "w") as f:
+        f.write("worker,seq,tag\n" if args.mixed else "worker,seq\n")
+
+    processes = [
+        multiprocessing.Process(target=process_main, args=(csv_path, args.mode, f"p{n}", args.threads, args.rows,
+                                                                args.flush_every, args.mixed))
+        for n in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    # The parent also runs threads with one handler each.
+    run_threads(csv_path, args.mode, "main", args.threads, args.rows, args.flush_every, shared=False, mixed=args.mixed)
+    for process in processes:
+        process.join()
+
+    # flush() has to leave everything in the CSV itself, journal included.
+    open_handler(csv_path, args.mode).flush()
+    if os.path.exists(csv_path + ".journal"):
+        print("JOURNAL NOT FOLDED INTO THE CSV")
+        sys.exit(1)
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    expected = (args.processes + 1) * args.threads * args.rows
+    keys = set(zip(df["worker"].astype(str), df["seq"].astype(str)))
+    print(f"mode={args.mode} expected={expected} rows={len(df)} unique={len(keys)} file={csv_path}")
+    if len(df) != expected or len(keys) != expected:
+        print("LOST OR DUPLICATED UPDATES")
+        sys.exit(1)
+    if args.mixed:
+        wrong = df[df["tag"].astype(str) != df["worker"].astype(str) + ":" + df["seq"].astype(str)]
+        if len(wrong):
+            print(f"{len(wrong)} ROWS TAGGED FOR ANOTHER ROW")
+            sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+# Resolves the column names the agent writes ("customer id", "Salary",
+# "cust_id") to real columns. Names are indexed once per set of columns:
+# folded to lowercase with runs of spaces, underscores and dashes
+# collapsed, plus trigram postings for substring lookups and ranked
+# "did you mean" suggestions. Lookups never scan every column.
+
+MAX_LISTED = 30
+MIN_SIMILARITY = 0.4
+
+
+def normalize(name):
+    return " ".join(re.sub(r"[\s_\-]+", " ", str(name)).lower().split())
+
+
+def _grams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ColumnIndex:
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._exact = set(self.columns)
+        self._position = {col: i for i, col in enumerate(self.columns)}
+        self._folded = {}
+        self._normalized = defaultdict(list)
+        self._compact = defaultdict(list)
+        self._postings = defaultdict(set)
+        for col in self.columns:
+            folded = self._folded[col] = normalize(col)
+            self._normalized[folded].append(col)
+            self._compact[folded.replace(" ", "")].append(col)
+            # Padded so word starts and ends weigh in on similarity.
+            for gram in _grams(f" {folded} "):
+                self._postings[gram].add(col)
+
+    def resolve(self, name):
+        # Returns (column, None) or (None, error message), like match_column.
+        if name in self._exact:
+            return name, None
+        folded = normalize(name)
+        for matches in (self._normalized.get(folded), self._compact.get(folded.replace(" ", ""))):
+            if matches and len(matches) == 1:
+                return matches[0], None
+        matches = self.containing(folded)
+        if len(matches) == 1:
+            return matches[0], None
+        if matches:
+            return None, f"Multiple columns match '{name}': {self._listing(matches)}. Please be more specific."
+        suggestions = self.suggest(name)
+        hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+        return None, f"Column '{name}' does not exist.{hint} Available columns: {self._listing(self.columns)}"
+
+    def containing(self, folded):
+        # Columns whose folded name contains folded: candidates share all
+        # of its trigrams, then each is checked.
+        if not folded:
+            return []
+        if len(folded) < 3:
+            candidates = self.columns
+        else:
+            postings = sorted((self._postings.get(gram, set()) for gram in _grams(folded)), key=len)
+            candidates = set.intersection(*postings) if postings else set()
+        return sorted((col for col in candidates if folded in self._folded[col]), key=self._position.get)
+
+    def suggest(self, name, limit=3):
+        # Columns ranked by trigram overlap (Dice coefficient) with name.
+        grams = _grams(f" {normalize(name)} ")
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        scored = []
+        for col, count in shared.items():
+            # A padded name of length n has n trigrams.
+            score = 2 * count / (len(grams) + len(self._folded[col]))
+            if score >= MIN_SIMILARITY:
+                scored.append((score, col))
+        scored.sort(key=lambda item: -item[0])
+        return [col for _, col in scored[:limit]]
+
+    def _listing(self, names):
+        if len(names) <= MAX_LISTED:
+            return ", ".join(map(str, names))
+        return ", ".join(map(str, names[:MAX_LISTED])) + f", ... ({len(names) - MAX_LISTED} more)"
+
+
+@lru_cache(maxsize=32)
+def _cached_index(columns):
+    return ColumnIndex(columns)
+
+
+def column_index(columns):
+    if isinstance(columns, ColumnIndex):
+        return columns
+    return _cached_index(tuple(columns))
+
+
+def match_column(column_name, columns):
+    return column_index(columns).resolve(column_name)
+
+
+def resolve_columns(row_dict, columns):
+    # Maps the keys of row_dict to real column names.
+    resolved = {}
+    for key, value in row_dict.items():
+        column, error = match_column(key, columns)
+        if error:
+            return None, error
+        resolved[column] = value
+    return resolved, None
@@ -0,0 +1,54 @@
+import json
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+
+def cache_path(csv_path):
+    return csv_path + ".feather"
+
+
+def load_cached(csv_path, stamp):
+    # Returns the cached DataFrame if the Feather shadow of csv_path was
+    # written for exactly this CSV mtime/size, otherwise None.
+    if feather is None or stamp is None:
+        return None
+    try:
+        table = feather.read_table(cache_path(csv_path), memory_map=True)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    meta = table.schema.metadata or {}
+    if json.loads(meta.get(b"csv_stamp", b"null")) != list(stamp):
+        return None
+    return table.to_pandas()
+
+
+def store_cache(df, csv_path, stamp):
+    # Uncompressed so later reads can be memory-mapped without copying.
+    if feather is None or stamp is None:
+        return False
+    path = cache_path(csv_path)
+    tmp_path = path + ".tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[b"csv_stamp"] = json.dumps(list(stamp)).encode()
+        feather.write_feather(table.replace_schema_metadata(meta), tmp_path, compression="uncompressed")
+    except (pa.ArrowException, TypeError, ValueError):
+        # Mixed-type object columns can't be stored, fall back to the CSV.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        drop_cache(csv_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+def drop_cache(csv_path):
+    if os.path.exists(cache_path(csv_path)):
+        os.remove(cache_path(csv_path))
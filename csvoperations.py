@@ -1,49 +1,571 @@
+import csv
+import io
+import json
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import partial
+import numpy as np
 import pandas as pd
+from columnindex import ColumnIndex, match_column, resolve_columns
+from csvcache import cache_path, load_cached, store_cache
+from csvprofile import PREVIEW_COLUMNS, PREVIEW_ROWS, profile_columns, render_profile
+from csvutil import coerce_value, file_stamp, parse_row_selection, parse_row_spec
+from locking import (ConcurrentModificationError, FileLock, read_version, reading, rwlock_for,
+                     write_version, writing)
+from metrics import span
+from parallelio import DEFAULT_ENGINE, DEFAULT_WORKERS, read_csv, to_csv
+from predicates import evaluate_predicate
+from query import parse_query, render_result, run_query
+from schema import (assign_values, coerce_scalar, concat_rows, csv_text, date_detail, date_texts, date_witnesses,
+                    read_typed_csv, save_schema, schema_of, value_dtype)
+
+# Undo history kept per handler, in bytes of stored deltas and in steps.
+DEFAULT_HISTORY_BUDGET = int(os.getenv("CSV_HISTORY_BUDGET", 256 * 1024 * 1024))
+DEFAULT_HISTORY_LIMIT = 100
+# Upper bound on the size of get_csv_info's answer, in LLM tokens.
+DEFAULT_INFO_TOKENS = int(os.getenv("CSV_INFO_TOKENS", 800))
 
 class CSVHandler:
-    def __init__(self, csv_path):
+    def __init__(self, csv_path, session=False, flush_interval=None, journal=False, compact_threshold=1000,
+                 cache=True, lazy_export=False, history_budget=DEFAULT_HISTORY_BUDGET,
+                 history_limit=DEFAULT_HISTORY_LIMIT, parallel_io=DEFAULT_ENGINE, io_workers=DEFAULT_WORKERS):
         self.csv_path = csv_path
-        self._load_csv()
-        
+        # In session mode the DataFrame stays resident between calls and
+        # changes are only written back on flush() (or every flush_interval
+        # seconds), instead of a full read/write around every operation.
+        self.session = session
+        self.flush_interval = flush_interval
+        # With journal=True each operation is appended to a JSONL journal
+        # next to the CSV instead of rewriting it; the journal is replayed on
+        # load and folded into the CSV once it holds compact_threshold ops.
+        self.journal = journal
+        self.journal_path = csv_path + ".journal"
+        self.compact_threshold = compact_threshold
+        # A Feather copy of the data is kept next to the CSV (when pyarrow is
+        # installed) and loaded instead of re-parsing the text while it is
+        # fresh. With lazy_export=True, flush() only updates that copy and
+        # the CSV itself is written on export_csv().
+        self.cache = cache
+        self.lazy_export = lazy_export
+        self.dirty = False
+        # Set when flush() updated only the Feather copy, until the CSV is
+        # written again.
+        self.unexported = False
+        # parallel_io="processes" parses and writes large CSVs on io_workers
+        # processes; "pyarrow" parses them with pyarrow's threaded reader
+        # instead and writes them serially. None keeps pandas'
+        # single-threaded read_csv/to_csv.
+        self.parallel_io = parallel_io
+        self.io_workers = io_workers
+        # Writers hold an exclusive advisory lock on <csv>.lock plus the
+        # in-process write lock; every commit bumps the number in
+        # <csv>.version, compare-and-swap style, so a handler notices (and
+        # rebases onto) changes other handlers or processes made.
+        self.version_path = csv_path + ".version"
+        self._rw = rwlock_for(csv_path)
+        self._file_lock = FileLock(csv_path + ".lock")
+        # Every edit records its inverse (the dropped column, the removed
+        # rows, the overwritten cells) so it can be undone in memory. The
+        # oldest steps are forgotten once history_budget bytes or
+        # history_limit steps are exceeded.
+        self.history_budget = history_budget
+        self.history_limit = history_limit
+        self._undo = []
+        self._redo = []
+        # Column profiles behind get_csv_info, kept until an edit touches
+        # the column (row edits touch all of them), and the rendered text.
+        self.info_token_budget = DEFAULT_INFO_TOKENS
+        self._profile = None
+        self._stale_columns = set()
+        self._info = None
+        self._profile_lock = threading.Lock()
+        # Name lookups go through an index rebuilt only when columns change.
+        self._column_index = None
+        # Identifies this handler's unsaved edits in data_version.
+        self._token = uuid.uuid4().hex
+        self._edits = 0
+        # Appended rows collect here column by column and are merged into
+        # the frame the next time it is read, so an append doesn't copy
+        # the frame; on disk they are appended to the CSV, not rewritten.
+        self._df = pd.DataFrame()
+        self._staged = {}
+        self._staged_rows = 0
+        self._stage_lock = threading.RLock()
+        self._version = None
+        self._pending = []
+        self._stamp = None
+        self._journal_ops = 0
+        self._last_flush = time.monotonic()
+        with self._write_locked():
+            self._load_csv()
+
+    @property
+    def df(self):
+        if self._staged_rows:
+            # Readers may get here side by side under the read lock.
+            with self._stage_lock:
+                if self._staged_rows:
+                    staged = pd.DataFrame(self._staged, columns=self._df.columns, dtype=object)
+                    self._df = concat_rows(self._df, staged)
+                    self._staged = {}
+                    self._staged_rows = 0
+        return self._df
+
+    @df.setter
+    def df(self, value):
+        with self._stage_lock:
+            self._df = value
+            self._staged = {}
+            self._staged_rows = 0
+
+    def _stage_rows(self, rows):
+        # Under the same lock as the merge in df, which callers outside the
+        # handler's locks (e.g. workspace.frame_bytes) may trigger.
+        with self._stage_lock:
+            if len(self._df.columns) == 0:
+                self.df = concat_rows(self.df, pd.DataFrame(rows, dtype=object))
+                return
+            for col in self._df.columns:
+                self._staged.setdefault(col, []).extend(row.get(col) for row in rows)
+            self._staged_rows += len(rows)
+
+    @property
+    def data_version(self):
+        # Changes whenever the data might have: the files' stamps cover
+        # everything written, including other processes' changes; edits
+        # held only in this handler's memory add the handler and a count.
+        version = (os.path.abspath(self.csv_path),) + self._file_stamp()
+        if self.dirty and not self.journal:
+            version += (self._token, self._edits)
+        return version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        self.close()
+
+    def close(self):
+        # Releases the lock file's descriptor. Unflushed edits stay in
+        # memory; the handler can still be used and reopens it.
+        self._file_lock.close()
+
+    @contextmanager
+    def _write_locked(self):
+        with self._rw.write(), self._file_lock.exclusive():
+            yield
+
+    @contextmanager
+    def _read_locked(self):
+        # Reads run concurrently on the resident frame; if the files changed
+        # it is refreshed first, under the write lock.
+        if self._file_stamp() != self._stamp and not self._rw.owns_write():
+            with self._write_locked():
+                self._load_csv()
+        with self._rw.read(), self._file_lock.shared():
+            yield
+
+    def _file_stamp(self):
+        return (file_stamp(self.csv_path), file_stamp(self.journal_path), file_stamp(cache_path(self.csv_path)),
+                file_stamp(self.version_path))
+
     def _load_csv(self):
+        if self._stamp is not None:
+            # Only reload when someone else changed the files since we last
+            # read or wrote them, and only while holding the write lock.
+            if not self._rw.owns_write() or self._file_stamp() == self._stamp:
+                return
+        # Unflushed session edits are rebased onto the new data: journaled
+        # ones are already on disk, the others are re-applied below if they
+        # don't refer to rows by position.
+        pending = self._pending if self.dirty and not self.journal else []
+        self._version = read_version(self.version_path)
+        self._column_index = None
+        with span("parse", os.path.basename(self.csv_path)) as info:
+            df = load_cached(self.csv_path, file_stamp(self.csv_path)) if self.cache else None
+            info["source"] = "feather" if df is not None else "csv"
+            if df is None:
+                try:
+                    df = read_typed_csv(self.csv_path, read_csv=partial(
+                        read_csv, engine=self.parallel_io, workers=self.io_workers))
+                except FileNotFoundError:
+                    df = None
+                if df is not None and self.cache:
+                    store_cache(df, self.csv_path, file_stamp(self.csv_path))
+            info["rows"] = 0 if df is None else len(df)
+            info["bytes"] = (file_stamp(self.csv_path) or (0, 0))[1]
+        if df is None:
+            self.df = pd.DataFrame()
+            self._write()
+            return
+        self.df = df
+        # Someone else changed the data, so the recorded deltas and the
+        # profile no longer fit.
+        self._undo = []
+        self._redo = []
+        self._profile = None
+        self._info = None
+        self._replay_journal()
+        self._stamp = self._file_stamp()
+        if not all(map(_rebasable, pending)):
+            # The rows they meant may have moved; the other writer wins.
+            self.dirty = False
+            self._pending = []
+            raise ConcurrentModificationError(
+                f"{self.csv_path} was modified elsewhere; {len(pending)} unsaved edit(s) that refer to rows "
+                "by position were discarded. Check the current data and make them again."
+            )
+        for op in pending:
+            self._apply_op(op)
+
+    def _replay_journal(self):
+        self._journal_ops = 0
         try:
-            self.df = pd.read_csv(self.csv_path)
+            with open(self.journal_path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
         except FileNotFoundError:
-            self.df = pd.DataFrame()
-            self.save()
+            return
+        if not lines or json.loads(lines[0]).get("base") != list(file_stamp(self.csv_path) or []):
+            # Journal belongs to an older snapshot (e.g. we crashed right
+            # after compacting), its ops are already in the CSV.
+            os.remove(self.journal_path)
+            return
+        for line in lines[1:]:
+            try:
+                op = json.loads(line)
+            except ValueError:
+                # Torn write at the tail of the journal.
+                break
+            self._apply_op(op)
+            self._journal_ops += 1
+
+    def _apply(self, op, keep_redo=False):
+        inverses = []
+        self._apply_op(op, inverses)
+        inverse = inverses[0] if len(inverses) == 1 else {"op": "batch", "ops": inverses[::-1]}
+        self._undo.append({"op": op, "inverse": inverse, "bytes": _delta_bytes(inverse)})
+        if not keep_redo:
+            self._redo = []
+        self._trim_history()
+        self.save(op)
 
-    def save(self):
-        self.df.to_csv(self.csv_path, index=False)
+    def _trim_history(self):
+        while self._undo and (len(self._undo) > self.history_limit or self.history_bytes > self.history_budget):
+            self._undo.pop(0)
 
+    @property
+    def history_bytes(self):
+        return sum(entry["bytes"] for entry in self._undo)
+
+    def _inverse(self, op):
+        # The op that takes the frame back to how it is right now, before
+        # op is applied. Removed data is kept as pandas objects, so undoing
+        # a column drop just puts the same Series back.
+        kind = op["op"]
+        if kind == "remove_column":
+            column = op["column"]
+            return {"op": "insert_column", "column": column, "position": self.df.columns.get_loc(column),
+                    "values": self.df[column], "dtypes": {column: str(self.df[column].dtype)}}
+        if kind in ("remove_row", "delete_where"):
+            rows = _row_list(op["row"]) if kind == "remove_row" else self._matching_rows(op["where"])
+            return {"op": "insert_rows", "row": rows, "values": self.df.iloc[rows]}
+        if kind == "add_column":
+            return {"op": "remove_column", "column": op["column"]}
+        if kind in ("add_row", "add_rows"):
+            # Added values may have widened column dtypes (e.g. int to object).
+            # Staged rows count, but the frame isn't merged just for this.
+            added = 1 if kind == "add_row" else len(op["values"])
+            start = len(self._df) + self._staged_rows
+            return {"op": "remove_row", "row": list(range(start, start + added)),
+                    "dtypes": {col: str(dtype) for col, dtype in self._df.dtypes.items()}}
+        if kind in ("set_cell", "set_row", "update_where"):
+            rows = self._matching_rows(op["where"]) if kind == "update_where" else _row_list(op["row"])
+            columns = [op["column"]] if kind == "set_cell" else list(op["values"])
+            columns = [col for col in columns if col in self.df.columns]
+            return {"op": "restore_cells", "row": rows,
+                    "values": {col: self.df.loc[rows, col] for col in columns},
+                    "dtypes": {col: str(self.df[col].dtype) for col in columns}}
+        raise ValueError(f"Unknown operation '{kind}'")
+
+    def _touch(self, op):
+        kind = op["op"]
+        self._info = None
+        self._edits += 1
+        if kind in ("remove_column", "add_column", "insert_column"):
+            self._column_index = None
+        if self._profile is None:
+            return
+        if kind == "remove_column":
+            self._profile.pop(op["column"], None)
+        elif kind in ("add_column", "insert_column", "set_cell"):
+            self._stale_columns.add(op["column"])
+        elif kind in ("set_row", "update_where", "restore_cells"):
+            self._stale_columns.update(op["values"])
+        else:
+            self._profile = None
+
+    def _columns(self):
+        if self._column_index is None:
+            self._column_index = ColumnIndex(self._df.columns)
+        return self._column_index
+
+    def _restore_dtypes(self, dtypes):
+        for col, dtype in dtypes.items():
+            if col in self.df.columns and str(self.df[col].dtype) != dtype:
+                try:
+                    self.df[col] = self.df[col].astype(dtype)
+                except (TypeError, ValueError):
+                    pass
+
+    def _matching_rows(self, predicate):
+        return np.flatnonzero(evaluate_predicate(predicate, self.df).to_numpy()).tolist()
+
+    def _commit_version(self):
+        current = read_version(self.version_path)
+        if current != self._version:
+            raise ConcurrentModificationError(
+                f"{self.csv_path} was modified elsewhere (version {current}, expected {self._version})."
+            )
+        self._version = current + 1
+        write_version(self.version_path, self._version)
+
+    def _apply_op(self, op, inverses=None):
+        # "row" is a single index or a list of indices. When inverses is a
+        # list, the inverse of each applied op is appended to it.
+        kind = op["op"]
+        if inverses is not None and kind != "batch":
+            inverses.append(self._inverse(op))
+        if kind != "batch":
+            self._touch(op)
+        if kind == "remove_column":
+            self.df.drop(columns=[op["column"]], inplace=True)
+        elif kind == "remove_row":
+            self.df.drop(index=op["row"], inplace=True)
+            self.df.reset_index(drop=True, inplace=True)
+            self._restore_dtypes(op.get("dtypes", {}))
+        elif kind == "add_column":
+            # Values arrive as text and are converted to the column's dtype.
+            dtype = op.get("dtype") or value_dtype(op["value"])
+            value = coerce_scalar(op["value"], dtype, op["column"])
+            self.df[op["column"]] = pd.Series(value, index=self.df.index, dtype=dtype)
+        elif kind == "add_row":
+            self._stage_rows([op["values"]])
+        elif kind == "add_rows":
+            self._stage_rows(op["values"])
+        elif kind == "set_cell":
+            assign_values(self.df, op["row"], op["column"], op["value"])
+        elif kind == "set_row":
+            for col, val in op["values"].items():
+                assign_values(self.df, op["row"], col, val)
+        elif kind == "update_where":
+            mask = evaluate_predicate(op["where"], self.df)
+            for col, val in op["values"].items():
+                assign_values(self.df, mask, col, val)
+        elif kind == "delete_where":
+            mask = evaluate_predicate(op["where"], self.df)
+            self.df = self.df[~mask].reset_index(drop=True)
+        elif kind == "batch":
+            for sub_op in op["ops"]:
+                self._apply_op(sub_op, inverses)
+        elif kind == "insert_column":
+            values = op["values"]
+            position = min(op["position"], len(self.df.columns))
+            self.df.insert(position, op["column"], values.array if isinstance(values, pd.Series) else values)
+            # Replayed from the journal the values are a plain list.
+            self._restore_dtypes(op.get("dtypes", {}))
+        elif kind == "insert_rows":
+            # Puts rows back at the positions they were removed from.
+            rows = op["row"]
+            values = op["values"]
+            if not isinstance(values, pd.DataFrame):
+                values = pd.DataFrame(values, columns=self.df.columns)
+            keep = np.ones(len(self.df) + len(rows), dtype=bool)
+            keep[rows] = False
+            order = np.argsort(np.concatenate([np.flatnonzero(keep), rows]), kind="stable")
+            self.df = concat_rows(self.df, values).iloc[order].reset_index(drop=True)
+        elif kind == "restore_cells":
+            for col, values in op["values"].items():
+                assign_values(self.df, op["row"], col, values)
+            self._restore_dtypes(op["dtypes"])
+        else:
+            raise ValueError(f"Unknown operation '{kind}'")
+
+    @writing
+    def save(self, op=None):
+        if op is not None and self.journal:
+            self._append_journal(op)
+        if self.session:
+            self.dirty = True
+            if op is not None and not self.journal:
+                self._pending.append(op)
+            if self.flush_interval is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+        elif op is not None and not self.journal and _appended_rows(op) and self._appendable():
+            self._append_rows(_appended_rows(op))
+        elif op is None or not self.journal or self._journal_ops >= self.compact_threshold:
+            self._write()
+        self._stamp = self._file_stamp()
+
+    @writing
+    def flush(self):
+        self._load_csv()
+        # Journaled edits are folded into the CSV even outside a session.
+        if not self.dirty and not self._journal_ops:
+            return
+        if self.lazy_export and self.cache and store_cache(self.df, self.csv_path, file_stamp(self.csv_path)):
+            # The Feather copy now holds everything the journal did.
+            self._commit_version()
+            save_schema(self.csv_path, schema_of(self.df))
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journal_ops = 0
+            self.unexported = True
+            self._stamp = self._file_stamp()
+            self._last_flush = time.monotonic()
+        elif self._pending and all(map(_appended_rows, self._pending)) and self._appendable():
+            # Only rows were added since the last write.
+            self._append_rows([row for op in self._pending for row in _appended_rows(op)])
+        else:
+            self._write()
+        self.dirty = False
+        self._pending = []
+
+    @writing
+    def export_csv(self):
+        self._load_csv()
+        self._write()
+        self.dirty = False
+        self._pending = []
+
+    @writing
+    def compact(self):
+        self._load_csv()
+        self._write()
+
+    def _append_journal(self, op):
+        self._commit_version()
+        if self._journal_ops == 0 or not os.path.exists(self.journal_path):
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"base": list(file_stamp(self.csv_path) or [])}) + "\n")
+            self._journal_ops = 0
+        with span("save", os.path.basename(self.csv_path), target="journal") as info, \
+                open(self.journal_path, "a", encoding="utf-8") as f:
+            line = json.dumps(op, default=_json_default) + "\n"
+            f.write(line)
+            info["bytes"] = len(line)
+        self._journal_ops += 1
+
+    def _appendable(self):
+        # The CSV on disk must end in a complete line and have exactly the
+        # frame's columns as its header for rows to be appended to it.
+        if len(self._df.columns) == 0 or not (file_stamp(self.csv_path) or (0, 0))[1]:
+            return False
+        with open(self.csv_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                return False
+        with open(self.csv_path, newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        return header == [str(col) for col in self._df.columns]
+
+    def _append_rows(self, rows):
+        # Only the new rows are written, in the header's column order and
+        # quoted and formatted as to_csv would write them.
+        dtypes = schema_of(self._df)
+        values = {col: [coerce_scalar(row.get(col), dtype, col) for row in rows] for col, dtype in dtypes.items()}
+        texts = {}
+        dates = [col for col, dtype in dtypes.items() if dtype.startswith("datetime")]
+        if dates:
+            # to_csv formats a datetime column as a whole, so new values take
+            # the format of the ones on disk. A new value that needs more
+            # detail (a time where there were only dates) changes the format
+            # of the whole column, and the file is rewritten instead.
+            old = date_witnesses(self.df.iloc[:len(self.df) - len(rows)][dates])
+            for col in dates:
+                new = pd.Series(values[col], dtype=dtypes[col])
+                witness = date_witnesses(pd.DataFrame({col: new})).get(col)
+                if col in old and witness is not None and date_detail(witness) > date_detail(old[col]):
+                    self._write()
+                    return
+                texts[col] = date_texts(new, old.get(col, witness))
+        self._commit_version()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator=os.linesep)
+        for i in range(len(rows)):
+            writer.writerow([texts[col][i] if col in texts else csv_text(values[col][i], dtype)
+                             for col, dtype in dtypes.items()])
+        text = buffer.getvalue()
+        with span("save", os.path.basename(self.csv_path), target="append", rows=len(rows), bytes=len(text)), \
+                open(self.csv_path, "a", newline="", encoding="utf-8") as f:
+            f.write(text)
+        self._stamp = self._file_stamp()
+        self._last_flush = time.monotonic()
+
+    def _write(self):
+        self._commit_version()
+        tmp_path = self.csv_path + ".tmp"
+        with span("save", os.path.basename(self.csv_path), target="csv", rows=len(self.df)) as info:
+            to_csv(self.df, tmp_path, self.parallel_io, self.io_workers)
+            os.replace(tmp_path, self.csv_path)
+            info["bytes"] = os.path.getsize(self.csv_path)
+            save_schema(self.csv_path, schema_of(self.df))
+            if self.cache:
+                store_cache(self.df, self.csv_path, file_stamp(self.csv_path))
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_ops = 0
+        self.unexported = False
+        self._stamp = self._file_stamp()
+        self._last_flush = time.monotonic()
+
+    @reading
     def get_column_names(self):
         self._load_csv() 
         return list(self.df.columns)
         
-    def get_csv_info(self):
+    @reading
+    def get_csv_info(self, token_budget=None):
         self._load_csv() 
-        columns = self.get_column_names()
-        num_rows = len(self.df)
-        preview = self.df.head(3).to_string()
-        return f"CSV has {num_rows} rows and columns: {', '.join(columns)}\nPreview:\n{preview}"
+        token_budget = token_budget or self.info_token_budget
+        with self._profile_lock:
+            if self._info is None or self._info[0] != token_budget:
+                columns = list(self.df.columns)
+                if self._profile is None:
+                    self._profile = profile_columns(self.df, columns)
+                else:
+                    stale = [col for col in columns if col in self._stale_columns or col not in self._profile]
+                    self._profile.update(profile_columns(self.df, stale))
+                self._stale_columns = set()
+                preview = self.df.iloc[:PREVIEW_ROWS, :PREVIEW_COLUMNS].to_string()
+                self._info = (token_budget, render_profile(len(self.df), columns, self._profile, preview, token_budget))
+            return self._info[1]
+
+    @reading
+    def get_row(self, row_spec):
+        self._load_csv()
+        try:
+            row_index = parse_row_spec(row_spec, len(self.df))
+        except ValueError:
+            return f"Invalid row specifier '{row_spec}'. Use a number, 'first', or 'last'."
+        if row_index < 0 or row_index >= len(self.df):
+            return f"Row index {row_index} is out of range (0-{len(self.df)-1})."
+        return f"Row {row_index}: {self.df.iloc[row_index].to_dict()}"
 
+    @writing
     def remove_column(self, column_name: str):
         self._load_csv() 
-        columns = self.get_column_names()
-        
-        if column_name not in columns:
-            matches = [col for col in columns if column_name.lower() in col.lower()]
-            if len(matches) == 1:
-                column_name = matches[0]
-            elif len(matches) > 1:
-                return f"Multiple columns match '{column_name}': {', '.join(matches)}. Please be more specific."
-            else:
-                return f"Column '{column_name}' does not exist. Available columns: {', '.join(columns)}"
+        column_name, error = match_column(column_name, self._columns())
+        if error:
+            return error
                 
-        self.df.drop(columns=[column_name], inplace=True)
-        self.save()
+        self._apply({"op": "remove_column", "column": column_name})
         return f"Column '{column_name}' removed."
 
+    @writing
     def remove_row(self, index_or_desc: str):
         self._load_csv() 
         try:
@@ -58,14 +580,13 @@ class CSVHandler:
                 return f"Row index {index} is out of range (0-{len(self.df)-1})."
                 
             removed_row = self.df.iloc[index].to_dict()
-            self.df.drop(index=index, inplace=True)
-            self.df.reset_index(drop=True, inplace=True)
-            self.save()
+            self._apply({"op": "remove_row", "row": index})
             return f"Row {index} removed: {removed_row}"
             
         except ValueError:
             return f"Invalid row specifier. Use a number, 'first', or 'last'."
 
+    @writing
     def add_column(self, input_str: str):
         self._load_csv() 
         parts = [part.strip() for part in input_str.split("with")]
@@ -79,108 +600,308 @@ class CSVHandler:
             value_part = parts[1].strip()
             if "=" in value_part:
                 default_value = value_part.split("=")[1].strip()
-                try:
-                    if default_value.isdigit():
-                        default_value = int(default_value)
-                    else:
-                        default_value = float(default_value)
-                except:
-                    pass
         
-        self.df[column_name] = default_value
-        self.save()
-        return f"Column '{column_name}' added with default value: '{default_value}'."
+        dtype = value_dtype(default_value)
+        self._apply({"op": "add_column", "column": column_name, "value": default_value, "dtype": dtype})
+        return f"Column '{column_name}' ({dtype}) added with default value: '{default_value}'."
 
+    @writing
     def add_row(self, row_dict: dict):
         self._load_csv() 
-        missing_cols = [col for col in row_dict if col not in self.df.columns]
-        if missing_cols:
-            return f"Columns don't exist: {', '.join(missing_cols)}. Available columns: {', '.join(self.df.columns)}"
-        for col in self.df.columns:
+        row_dict, error = resolve_columns(row_dict, self._columns())
+        if error:
+            return error
+        # Only the columns and dtypes are needed, so rows appended earlier
+        # stay staged.
+        for col in self._df.columns:
             if col not in row_dict:
                 row_dict[col] = ""
+        error = check_values(row_dict, schema_of(self._df))
+        if error:
+            return error
                 
-        self.df = pd.concat([self.df, pd.DataFrame([row_dict])], ignore_index=True)
-        self.save()
+        self._apply({"op": "add_row", "values": row_dict})
         return f"Row added: {row_dict}"
 
+    @writing
     def set_cell(self, row_spec, column_name, value):
         self._load_csv() 
         try:
-            if isinstance(row_spec, str):
-                if row_spec.lower() == "last":
-                    row_index = len(self.df) - 1
-                elif row_spec.lower() == "first":
-                    row_index = 0
-                else:
-                    row_index = int(row_spec)
-            else:
-                row_index = int(row_spec)
+            row_index = parse_row_spec(row_spec, len(self.df))
         except ValueError:
             return f"Invalid row specifier '{row_spec}'. Use a number, 'first', or 'last'."
             
         if row_index < 0 or row_index >= len(self.df):
             return f"Row index {row_index} is out of range (0-{len(self.df)-1})."
             
-        columns = self.get_column_names()
-        if column_name not in columns:
-            matches = [col for col in columns if column_name.lower() in col.lower()]
-            if len(matches) == 1:
-                column_name = matches[0]
-            elif len(matches) > 1:
-                return f"Multiple columns match '{column_name}': {', '.join(matches)}. Please be more specific."
-            else:
-                return f"Column '{column_name}' does not exist. Available columns: {', '.join(columns)}"
+        column_name, error = match_column(column_name, self._columns())
+        if error:
+            return error
                 
-        try:
-            if str(value).isdigit():
-                value = int(value)
-            elif str(value).replace('.', '', 1).isdigit() and str(value).count('.') <= 1:
-                value = float(value)
-        except:
-            pass
+        error = check_values({column_name: value}, schema_of(self.df))
+        if error:
+            return error
             
-        self.df.at[row_index, column_name] = value
-        self.save()
+        self._apply({"op": "set_cell", "row": row_index, "column": column_name, "value": value})
         return f"Value set at row {row_index}, column '{column_name}' to '{value}'."
 
+    @writing
     def set_row(self, row_spec, row_dict):
         self._load_csv() 
         try:
-            if isinstance(row_spec, str):
-                if row_spec.lower() == "last":
-                    row_index = len(self.df) - 1
-                elif row_spec.lower() == "first":
-                    row_index = 0
-                else:
-                    row_index = int(row_spec)
-            else:
-                row_index = int(row_spec)
+            row_index = parse_row_spec(row_spec, len(self.df))
         except ValueError:
             return f"Invalid row specifier '{row_spec}'. Use a number, 'first', or 'last'."
             
         if row_index < 0 or row_index >= len(self.df):
             return f"Row index {row_index} is out of range (0-{len(self.df)-1})."
             
-        columns = self.get_column_names()
-        for col in row_dict:
-            if col not in columns:
-                return f"Column '{col}' does not exist. Available columns: {', '.join(columns)}"
-                
-        for col, val in row_dict.items():
-            try:
-                if str(val).isdigit():
-                    val = int(val)
-                elif str(val).replace('.', '', 1).isdigit() and str(val).count('.') <= 1:
-                    val = float(val)
-            except:
-                pass
-                
-            self.df.at[row_index, col] = val
+        row_dict, error = resolve_columns(row_dict, self._columns())
+        if error:
+            return error
+        error = check_values(row_dict, schema_of(self.df))
+        if error:
+            return error
             
-        self.save()
+        self._apply({"op": "set_row", "row": row_index, "values": dict(row_dict)})
         return f"Row {row_index} updated: {row_dict}"
 
+    @writing
+    def update_where(self, predicate, row_dict):
+        self._load_csv()
+        row_dict, error = resolve_columns(row_dict, self._columns())
+        if error:
+            return error
+        try:
+            count = int(evaluate_predicate(predicate, self.df).sum())
+        except ValueError as e:
+            return f"Invalid condition '{predicate}': {e}"
+        if count == 0:
+            return f"No rows match '{predicate}'."
+
+        error = check_values(row_dict, schema_of(self.df))
+        if error:
+            return error
+
+        values = dict(row_dict)
+        self._apply({"op": "update_where", "where": predicate, "values": values})
+        return f"Updated {count} row(s) matching '{predicate}': {values}"
+
+    @writing
+    def delete_where(self, predicate):
+        self._load_csv()
+        try:
+            count = int(evaluate_predicate(predicate, self.df).sum())
+        except ValueError as e:
+            return f"Invalid condition '{predicate}': {e}"
+        if count == 0:
+            return f"No rows match '{predicate}'."
+
+        self._apply({"op": "delete_where", "where": predicate})
+        return f"Removed {count} row(s) matching '{predicate}'. {len(self.df)} rows remain."
+
+    @writing
+    def undo(self, steps=1):
+        self._load_csv()
+        undone = []
+        for _ in range(steps):
+            if not self._undo:
+                break
+            entry = self._undo.pop()
+            self._apply_op(entry["inverse"])
+            self.save(entry["inverse"])
+            self._redo.append({"op": entry["op"]})
+            undone.append(describe_op(entry["op"]))
+        if not undone:
+            return "Nothing to undo."
+        return f"Undid {len(undone)} edit(s): " + "; ".join(undone)
+
+    @writing
+    def redo(self, steps=1):
+        self._load_csv()
+        redone = []
+        for _ in range(steps):
+            if not self._redo:
+                break
+            op = self._redo.pop()["op"]
+            self._apply(op, keep_redo=True)
+            redone.append(describe_op(op))
+        if not redone:
+            return "Nothing to redo."
+        return f"Redid {len(redone)} edit(s): " + "; ".join(redone)
+
+    @reading
+    def list_history(self):
+        self._load_csv()
+        if not self._undo and not self._redo:
+            return "No edits to undo or redo."
+        lines = [f"{i}. {describe_op(entry['op'])}" for i, entry in enumerate(self._undo, 1)]
+        text = "Edits that can be undone (oldest first):\n" + "\n".join(lines) if lines else "Nothing to undo."
+        if self._redo:
+            text += f"\n{len(self._redo)} undone edit(s) can be redone, next: {describe_op(self._redo[-1]['op'])}"
+        return text + f"\nHistory uses {self.history_bytes / 1024 / 1024:.1f} MiB of {self.history_budget / 1024 / 1024:.0f} MiB."
+
+    @reading
+    def query(self, spec):
+        self._load_csv()
+        try:
+            result = run_query(self.df, parse_query(spec, self._columns()))
+        except (TypeError, ValueError) as e:
+            return f"Invalid query '{spec}': {e}"
+        return render_result(result)
+
+    @writing
+    def apply_batch(self, ops):
+        # Validates every operation against the state left by the ones before
+        # it, then applies them all with one save. Nothing is applied if any
+        # operation is invalid.
+        self._load_csv()
+        columns = list(self.df.columns)
+        dtypes = schema_of(self.df)
+        num_rows = len(self.df)
+        resolved = []
+        summary = []
+        for position, op in enumerate(ops, 1):
+            kind = op.get("op")
+            try:
+                if kind == "set_cell":
+                    rows = parse_row_selection(op["rows"], num_rows)
+                    column, error = match_column(op["column"], columns)
+                    if error:
+                        raise ValueError(error)
+                    value = op["value"]
+                    check_values({column: value}, dtypes, raise_error=True)
+                    resolved.append({"op": kind, "row": rows, "column": column, "value": value})
+                    summary.append(f"set '{column}' to '{value}' in {len(rows)} row(s)")
+                elif kind == "set_row":
+                    rows = parse_row_selection(op["rows"], num_rows)
+                    values, error = resolve_columns(op["values"], columns)
+                    if error:
+                        raise ValueError(error)
+                    check_values(values, dtypes, raise_error=True)
+                    resolved.append({"op": kind, "row": rows, "values": values})
+                    summary.append(f"updated {len(rows)} row(s) with {values}")
+                elif kind == "add_row":
+                    values, error = resolve_columns(op["values"], columns)
+                    if error:
+                        raise ValueError(error)
+                    row = {col: values.get(col, "") for col in columns}
+                    check_values(row, dtypes, raise_error=True)
+                    if resolved and resolved[-1]["op"] == "add_rows":
+                        resolved[-1]["values"].append(row)
+                    else:
+                        resolved.append({"op": "add_rows", "values": [row]})
+                    num_rows += 1
+                    summary.append(f"added row {row}")
+                elif kind == "remove_row":
+                    rows = parse_row_selection(op["rows"], num_rows)
+                    resolved.append({"op": kind, "row": rows})
+                    num_rows -= len(rows)
+                    summary.append(f"removed {len(rows)} row(s)")
+                elif kind == "add_column":
+                    if op["column"] in columns:
+                        raise ValueError(f"Column '{op['column']}' already exists.")
+                    value = op.get("value", "")
+                    dtypes[op["column"]] = value_dtype(value)
+                    resolved.append({"op": kind, "column": op["column"], "value": value, "dtype": dtypes[op["column"]]})
+                    columns.append(op["column"])
+                    summary.append(f"added column '{op['column']}'")
+                elif kind == "remove_column":
+                    column, error = match_column(op["column"], columns)
+                    if error:
+                        raise ValueError(error)
+                    resolved.append({"op": kind, "column": column})
+                    columns.remove(column)
+                    del dtypes[column]
+                    summary.append(f"removed column '{column}'")
+                else:
+                    raise ValueError(f"Unrecognized operation '{op.get('text', kind)}'.")
+            except (KeyError, ValueError) as e:
+                return f"Operation {position} failed: {e} No changes were applied."
+
+        if not resolved:
+            return "No operations given."
+        self._apply({"op": "batch", "ops": resolved})
+        if len(summary) > 10:
+            summary = summary[:10] + [f"... and {len(summary) - 10} more"]
+        return f"Applied {len(ops)} operation(s): " + "; ".join(summary)
+
+def check_values(values, dtypes, raise_error=False):
+    # Returns (or raises) the first value that doesn't fit its column's dtype.
+    for col, value in values.items():
+        try:
+            coerce_scalar(value, dtypes[col], col)
+        except ValueError as e:
+            if raise_error:
+                raise
+            return str(e)
+    return None
+
+def _row_list(row):
+    return [int(row)] if np.isscalar(row) else [int(index) for index in row]
+
+def _delta_bytes(value):
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=False, deep=True))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=False, deep=True).sum())
+    if isinstance(value, dict):
+        return sum(_delta_bytes(item) for item in value.values())
+    if isinstance(value, list):
+        if value and isinstance(value[0], (dict, list, pd.Series, pd.DataFrame)):
+            return sum(_delta_bytes(item) for item in value)
+        return 8 * len(value)
+    return 64
+
+def _rebasable(op):
+    # Ops that mean the same thing on data someone else changed: appends,
+    # edits by condition and by column name.
+    if op["op"] == "batch":
+        return all(map(_rebasable, op["ops"]))
+    return op["op"] in ("add_row", "add_rows", "update_where", "delete_where", "add_column", "remove_column")
+
+def _appended_rows(op):
+    # The rows op adds, or None if it does anything besides adding rows.
+    kind = op["op"]
+    if kind == "add_row":
+        return [op["values"]]
+    if kind == "add_rows":
+        return list(op["values"])
+    if kind == "batch":
+        rows = [_appended_rows(sub_op) for sub_op in op["ops"]]
+        if all(rows):
+            return [row for sub_rows in rows for row in sub_rows]
+    return None
+
+def describe_op(op):
+    kind = op["op"]
+    if kind == "batch":
+        return f"batch of {len(op['ops'])} edit(s)"
+    if kind in ("update_where", "delete_where"):
+        return f"{kind.replace('_', ' ')} {op['where']}"
+    if kind == "add_rows":
+        return f"add {len(op['values'])} row(s)"
+    text = kind.replace("_", " ")
+    if "column" in op:
+        text += f" '{op['column']}'"
+    if "row" in op:
+        rows = _row_list(op["row"])
+        text += f" at row {rows[0]}" if len(rows) == 1 else f" in {len(rows)} rows"
+    return text
+
+def _json_default(value):
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    # Deltas journaled by undo carry whole columns and rows.
+    if isinstance(value, pd.Series):
+        return value.tolist()
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict("records")
+    # numpy scalars coming out of the DataFrame
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
 def parse_kv_string(input_str: str):
     parts = [kv.strip() for kv in input_str.split(",")]
     parsed = {}
@@ -188,4 +909,45 @@ def parse_kv_string(input_str: str):
         if "=" in part:
             k, v = part.split("=", 1)
             parsed[k.strip()] = v.strip()
-    return parsed 
\ No newline at end of file
+    return parsed
+
+BATCH_COMMANDS = {
+    "set": "set_cell",
+    "setrow": "set_row",
+    "addrow": "add_row",
+    "removerow": "remove_row",
+    "addcol": "add_column",
+    "removecol": "remove_column",
+}
+
+def parse_batch_string(input_str: str):
+    # One command per line or ';'-separated, e.g.
+    #   set 1-500, salary, 0; removerow last; addrow name=Ann, age=31
+    ops = []
+    for command in input_str.replace("\n", ";").split(";"):
+        command = command.strip()
+        if not command:
+            continue
+        name, _, args = command.partition(" ")
+        kind = BATCH_COMMANDS.get(name.lower())
+        args = args.strip()
+        if kind == "set_cell" and args.count(",") >= 2:
+            rows, column, value = [part.strip() for part in args.split(",", 2)]
+            ops.append({"op": kind, "rows": rows, "column": column, "value": value})
+        elif kind == "set_row" and ":" in args:
+            rows, kv = args.split(":", 1)
+            ops.append({"op": kind, "rows": rows.strip(), "values": parse_kv_string(kv)})
+        elif kind == "add_row":
+            ops.append({"op": kind, "values": parse_kv_string(args)})
+        elif kind == "remove_row" and args:
+            ops.append({"op": kind, "rows": args})
+        elif kind == "add_column" and args:
+            column, _, default = args.partition(" with ")
+            value = default.split("=", 1)[1].strip() if "=" in default else ""
+            ops.append({"op": kind, "column": column.strip(), "value": value})
+        elif kind == "remove_column" and args:
+            ops.append({"op": kind, "column": args})
+        else:
+            ops.append({"op": "invalid", "text": command})
+    return ops
+
@@ -0,0 +1,87 @@
+import pandas as pd
+from schema import dtype_name
+
+# Per-column summaries for GetCSVInfo: dtype, missing values, distinct
+# count, range or most common values. Handlers cache them and only
+# recompute the columns an edit touched.
+
+TOP_VALUES = 3
+PREVIEW_ROWS = 3
+PREVIEW_COLUMNS = 8
+MAX_VALUE_CHARS = 24
+
+
+def profile_columns(df, columns):
+    sub = df[columns]
+    nulls = sub.isna().sum()
+    profiles = {}
+    for col in columns:
+        series = sub[col]
+        dtype = dtype_name(series)
+        entry = {"dtype": dtype, "nulls": int(nulls[col]), "unique": int(series.nunique())}
+        if dtype in ("Int64", "float64") or dtype.startswith("datetime"):
+            if entry["nulls"] < len(series):
+                entry["min"], entry["max"] = series.min(), series.max()
+        elif 0 < entry["unique"] < len(series) - entry["nulls"]:
+            # Skipped when every value is distinct (names, ids, ...).
+            top = series.value_counts().head(TOP_VALUES)
+            entry["top"] = [(value, int(count)) for value, count in top.items()]
+        profiles[col] = entry
+    return profiles
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English and numbers.
+    return len(text) // 4 + 1
+
+
+def _short(value):
+    if isinstance(value, float):
+        text = f"{value:g}"
+    elif isinstance(value, pd.Timestamp):
+        text = value.isoformat(sep=" ").removesuffix(" 00:00:00")
+    else:
+        text = str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 3] + "..."
+
+
+def describe_column(col, entry, detail=True):
+    text = f"- {col}: {entry['dtype']}"
+    if entry["nulls"]:
+        text += f", {entry['nulls']} empty"
+    text += f", {entry['unique']} distinct"
+    if detail and "min" in entry:
+        text += f", {_short(entry['min'])} to {_short(entry['max'])}"
+    elif detail and "top" in entry:
+        text += ", top: " + ", ".join(f"{_short(value)} ({count})" for value, count in entry["top"])
+    return text
+
+
+def render_profile(rows, columns, profiles, preview, token_budget):
+    # Full detail if it fits the budget, then without ranges and top
+    # values, then as many columns as fit followed by the other names.
+    header = f"CSV has {rows} rows and {len(columns)} columns."
+    for detail in (True, False):
+        lines = [describe_column(col, profiles[col], detail) for col in columns]
+        text = header + "\nColumns:\n" + "\n".join(lines)
+        if estimate_tokens(text) <= token_budget:
+            break
+    else:
+        used = estimate_tokens(header) + 20
+        kept = []
+        for line in lines:
+            if used + estimate_tokens(line) > token_budget * 3 // 4:
+                break
+            kept.append(line)
+            used += estimate_tokens(line)
+        rest = columns[len(kept):]
+        names = ""
+        for col in rest:
+            if used + estimate_tokens(names + col) > token_budget:
+                names += ", ..."
+                break
+            names += (", " if names else "") + col
+        text = header + "\nColumns:\n" + "\n".join(kept) + f"\n... and {len(rest)} more columns: {names}"
+    if preview and estimate_tokens(text + preview) <= token_budget:
+        text += "\nPreview:\n" + preview
+    return text
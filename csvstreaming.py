@@ -0,0 +1,414 @@
+import bisect
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from columnindex import match_column, resolve_columns
+from csvutil import coerce_value, file_stamp, parse_row_selection, parse_row_spec
+from predicates import evaluate_predicate, predicate_columns
+from query import needed_columns, parse_query, render_result, scan_query
+from rowindex import RowIndex, format_record
+
+DEFAULT_CHUNKSIZE = 100_000
+COPY_BUFFER = 1 << 24
+
+
+class StreamingCSVHandler:
+    # Same interface as CSVHandler, but never holds more than one chunk of
+    # the file in memory. Cells are read as text (dtype=str) so untouched
+    # chunks are copied through byte-for-byte equivalent on rewrite. Single
+    # row reads and edits go through the byte-offset RowIndex and never parse
+    # more than the affected row.
+    def __init__(self, csv_path, chunksize=DEFAULT_CHUNKSIZE):
+        self.csv_path = csv_path
+        self.chunksize = chunksize
+        self.index = RowIndex(csv_path)
+        self._columns = None
+        self._stamp = None
+        if not os.path.exists(csv_path):
+            open(csv_path, "w").close()
+
+    def _refresh(self):
+        stamp = file_stamp(self.csv_path)
+        if stamp != self._stamp:
+            self._columns = None
+            self._stamp = stamp
+
+    def _read(self, **kwargs):
+        return pd.read_csv(self.csv_path, dtype=str, keep_default_na=False, **kwargs)
+
+    def _chunks(self, **kwargs):
+        try:
+            yield from self._read(chunksize=self.chunksize, **kwargs)
+        except pd.errors.EmptyDataError:
+            return
+
+    def _count_rows(self):
+        return self.index.count
+
+    def _rewrite(self, transform, tail=None, **kwargs):
+        # Streams the file through transform(chunk, first_row_index) into a
+        # temp file and swaps it in; transform returns the chunk to write.
+        # Rows in the tail DataFrame are written after the last chunk.
+        tmp_path = self.csv_path + ".tmp"
+        start = 0
+        header = True
+        with open(tmp_path, "w", newline="", encoding="utf-8") as out:
+            for chunk in self._chunks(**kwargs):
+                size = len(chunk)
+                chunk = transform(chunk, start)
+                start += size
+                chunk.to_csv(out, index=False, header=header)
+                header = False
+            if header:
+                # No data rows, still carry the (transformed) header over.
+                try:
+                    empty = self._read(nrows=0, **kwargs)
+                except pd.errors.EmptyDataError:
+                    empty = pd.DataFrame()
+                transform(empty, 0).to_csv(out, index=False)
+            if tail is not None:
+                tail.to_csv(out, index=False, header=False)
+        os.replace(tmp_path, self.csv_path)
+        self.index.invalidate()
+        self._refresh()
+
+    def _splice(self, start, stop, data):
+        # Replaces bytes [start, stop) of the file with data, in place when
+        # the length is unchanged, otherwise through a buffered stream copy.
+        if len(data) == stop - start:
+            with open(self.csv_path, "r+b") as f:
+                f.seek(start)
+                f.write(data)
+            return
+        tmp_path = self.csv_path + ".tmp"
+        with open(self.csv_path, "rb") as src, open(tmp_path, "wb") as out:
+            remaining = start
+            while remaining:
+                block = src.read(min(COPY_BUFFER, remaining))
+                out.write(block)
+                remaining -= len(block)
+            out.write(data)
+            src.seek(stop)
+            shutil.copyfileobj(src, out, COPY_BUFFER)
+        os.replace(tmp_path, self.csv_path)
+
+    def save(self):
+        pass
+
+    def flush(self):
+        self.index.save()
+
+    def export_csv(self):
+        # Edits already go straight to the CSV.
+        self.flush()
+
+    def get_column_names(self):
+        self._refresh()
+        if self._columns is None:
+            try:
+                self._columns = list(self._read(nrows=0).columns)
+            except pd.errors.EmptyDataError:
+                self._columns = []
+        return self._columns
+
+    def get_csv_info(self):
+        columns = self.get_column_names()
+        num_rows = self._count_rows()
+        preview = self._read(nrows=3).to_string() if columns else ""
+        return f"CSV has {num_rows} rows and columns: {', '.join(columns)}\nPreview:\n{preview}"
+
+    def _row_index(self, row_spec):
+        num_rows = self._count_rows()
+        row_index = parse_row_spec(row_spec, num_rows)
+        if row_index < 0 or row_index >= num_rows:
+            return None, f"Row index {row_index} is out of range (0-{num_rows-1})."
+        return row_index, None
+
+    def remove_column(self, column_name: str):
+        column_name, error = match_column(column_name, self.get_column_names())
+        if error:
+            return error
+
+        keep = [col for col in self.get_column_names() if col != column_name]
+        self._rewrite(lambda chunk, start: chunk, usecols=keep)
+        return f"Column '{column_name}' removed."
+
+    def remove_row(self, index_or_desc: str):
+        try:
+            index, error = self._row_index(index_or_desc)
+        except ValueError:
+            return f"Invalid row specifier. Use a number, 'first', or 'last'."
+        if error:
+            return error
+
+        removed = dict(zip(self.get_column_names(), self.index.read_row(index)))
+        start, stop = self.index.row_span(index)
+        self._splice(start, stop, b"")
+        self.index.deleted(index)
+        return f"Row {index} removed: {removed}"
+
+    def add_column(self, input_str: str):
+        parts = [part.strip() for part in input_str.split("with")]
+        column_name = parts[0].strip()
+
+        if column_name in self.get_column_names():
+            return f"Column '{column_name}' already exists."
+
+        default_value = ""
+        if len(parts) > 1 and "values" in parts[1] and "=" in parts[1]:
+            default_value = parts[1].split("=")[1].strip()
+
+        def transform(chunk, start):
+            chunk[column_name] = default_value
+            return chunk
+
+        self._rewrite(transform)
+        return f"Column '{column_name}' added with default value: '{default_value}'."
+
+    def add_row(self, row_dict: dict):
+        columns = self.get_column_names()
+        row_dict, error = resolve_columns(row_dict, columns)
+        if error:
+            return error
+        for col in columns:
+            if col not in row_dict:
+                row_dict[col] = ""
+
+        self.index.load()
+        record = format_record([row_dict[col] for col in columns])
+        with open(self.csv_path, "ab") as f:
+            start = f.seek(0, os.SEEK_END)
+            if start > 0:
+                with open(self.csv_path, "rb") as last:
+                    last.seek(start - 1)
+                    if last.read(1) != b"\n":
+                        f.write(b"\n")
+                        start += 1
+            f.write(record)
+        self.index.appended(start, start + len(record))
+        return f"Row added: {row_dict}"
+
+    def set_cell(self, row_spec, column_name, value):
+        try:
+            row_index, error = self._row_index(row_spec)
+        except ValueError:
+            return f"Invalid row specifier '{row_spec}'. Use a number, 'first', or 'last'."
+        if error:
+            return error
+
+        column_name, error = match_column(column_name, self.get_column_names())
+        if error:
+            return error
+
+        value = coerce_value(value)
+        self._set_values(row_index, {column_name: value})
+        return f"Value set at row {row_index}, column '{column_name}' to '{value}'."
+
+    def set_row(self, row_spec, row_dict):
+        try:
+            row_index, error = self._row_index(row_spec)
+        except ValueError:
+            return f"Invalid row specifier '{row_spec}'. Use a number, 'first', or 'last'."
+        if error:
+            return error
+
+        row_dict, error = resolve_columns(row_dict, self.get_column_names())
+        if error:
+            return error
+
+        self._set_values(row_index, {col: coerce_value(val) for col, val in row_dict.items()})
+        return f"Row {row_index} updated: {row_dict}"
+
+    def apply_batch(self, ops):
+        # Validates every operation against the state left by the ones before
+        # it, like CSVHandler.apply_batch, then applies them all in one pass
+        # over the file. Positions are mapped back to rows of the file as it
+        # is now: edits are kept per original row, removed rows as a sorted
+        # list, and added rows are written after the last chunk.
+        columns = list(self.get_column_names())
+        original_rows = self._count_rows()
+        removed = []
+        edits = {}
+        added = []
+        new_columns = {}
+        summary = []
+
+        def locate(rows):
+            # (original row or None, added row or None) for each position.
+            kept = original_rows - len(removed)
+            return [(_original_row(row, removed), None) if row < kept else (None, added[row - kept]) for row in rows]
+
+        def set_values(rows, values):
+            for original, row in locate(rows):
+                (row if row is not None else edits.setdefault(original, {})).update(values)
+
+        for position, op in enumerate(ops, 1):
+            kind = op.get("op")
+            num_rows = original_rows - len(removed) + len(added)
+            try:
+                if kind == "set_cell":
+                    rows = parse_row_selection(op["rows"], num_rows)
+                    column, error = match_column(op["column"], columns)
+                    if error:
+                        raise ValueError(error)
+                    set_values(rows, {column: str(coerce_value(op["value"]))})
+                    summary.append(f"set '{column}' to '{op['value']}' in {len(rows)} row(s)")
+                elif kind == "set_row":
+                    rows = parse_row_selection(op["rows"], num_rows)
+                    values, error = resolve_columns(op["values"], columns)
+                    if error:
+                        raise ValueError(error)
+                    set_values(rows, {col: str(coerce_value(val)) for col, val in values.items()})
+                    summary.append(f"updated {len(rows)} row(s) with {values}")
+                elif kind == "add_row":
+                    values, error = resolve_columns(op["values"], columns)
+                    if error:
+                        raise ValueError(error)
+                    row = {col: values.get(col, "") for col in columns}
+                    added.append(row)
+                    summary.append(f"added row {row}")
+                elif kind == "remove_row":
+                    rows = parse_row_selection(op["rows"], num_rows)
+                    located = locate(rows)
+                    for original, row in located:
+                        if row is not None:
+                            added.remove(row)
+                    for original, row in located:
+                        if original is not None:
+                            bisect.insort(removed, original)
+                            edits.pop(original, None)
+                    summary.append(f"removed {len(rows)} row(s)")
+                elif kind == "add_column":
+                    if op["column"] in columns:
+                        raise ValueError(f"Column '{op['column']}' already exists.")
+                    value = op.get("value", "")
+                    new_columns[op["column"]] = value
+                    for row in added:
+                        row[op["column"]] = value
+                    columns.append(op["column"])
+                    summary.append(f"added column '{op['column']}'")
+                elif kind == "remove_column":
+                    column, error = match_column(op["column"], columns)
+                    if error:
+                        raise ValueError(error)
+                    columns.remove(column)
+                    new_columns.pop(column, None)
+                    for values in list(edits.values()) + added:
+                        values.pop(column, None)
+                    summary.append(f"removed column '{column}'")
+                else:
+                    raise ValueError(f"Unrecognized operation '{op.get('text', kind)}'.")
+            except (KeyError, ValueError) as e:
+                return f"Operation {position} failed: {e} No changes were applied."
+
+        if not summary:
+            return "No operations given."
+        edited = sorted(edits)
+
+        def transform(chunk, start):
+            for col, value in new_columns.items():
+                chunk[col] = value
+            stop = start + len(chunk)
+            for original in edited[bisect.bisect_left(edited, start):bisect.bisect_left(edited, stop)]:
+                for col, value in edits[original].items():
+                    chunk.iat[original - start, chunk.columns.get_loc(col)] = value
+            keep = ~np.isin(np.arange(start, stop), removed)
+            return chunk.loc[keep, columns]
+
+        self._rewrite(transform, tail=pd.DataFrame(added, columns=columns) if added else None)
+        if len(summary) > 10:
+            summary = summary[:10] + [f"... and {len(summary) - 10} more"]
+        return f"Applied {len(ops)} operation(s): " + "; ".join(summary)
+
+    def _count_matches(self, predicate):
+        # Counts matching rows reading only the columns the condition uses;
+        # also rejects a bad condition before anything is rewritten.
+        columns = self.get_column_names()
+        usecols = [col for col in columns if col in predicate_columns(predicate, columns)] or columns[:1]
+        return sum(int(evaluate_predicate(predicate, chunk).sum()) for chunk in self._chunks(usecols=usecols))
+
+    def update_where(self, predicate, row_dict):
+        row_dict, error = resolve_columns(row_dict, self.get_column_names())
+        if error:
+            return error
+        try:
+            count = self._count_matches(predicate)
+        except ValueError as e:
+            return f"Invalid condition '{predicate}': {e}"
+        if count == 0:
+            return f"No rows match '{predicate}'."
+
+        values = {col: str(coerce_value(val)) for col, val in row_dict.items()}
+
+        def transform(chunk, start):
+            mask = evaluate_predicate(predicate, chunk)
+            for col, val in values.items():
+                chunk.loc[mask, col] = val
+            return chunk
+
+        self._rewrite(transform)
+        return f"Updated {count} row(s) matching '{predicate}': {row_dict}"
+
+    def delete_where(self, predicate):
+        try:
+            count = self._count_matches(predicate)
+        except ValueError as e:
+            return f"Invalid condition '{predicate}': {e}"
+        if count == 0:
+            return f"No rows match '{predicate}'."
+
+        self._rewrite(lambda chunk, start: chunk[~evaluate_predicate(predicate, chunk)])
+        return f"Removed {count} row(s) matching '{predicate}'. {self._count_rows()} rows remain."
+
+    def query(self, spec):
+        columns = self.get_column_names()
+        try:
+            query = parse_query(spec, columns)
+            usecols = needed_columns(query, columns)
+            result, total = scan_query(self._chunks(usecols=usecols), query)
+        except (TypeError, ValueError) as e:
+            return f"Invalid query '{spec}': {e}"
+        return render_result(result, total=total)
+
+    # Edits here go straight into the file without keeping what they
+    # replaced, so there is nothing to step back through.
+    def undo(self, steps=1):
+        return "Undo isn't available for this file: it is too large to keep history for."
+
+    def redo(self, steps=1):
+        return "Redo isn't available for this file: it is too large to keep history for."
+
+    def list_history(self):
+        return "No history is kept for this file: it is too large."
+
+    def get_row(self, row_spec):
+        try:
+            row_index, error = self._row_index(row_spec)
+        except ValueError:
+            return f"Invalid row specifier '{row_spec}'. Use a number, 'first', or 'last'."
+        if error:
+            return error
+        return f"Row {row_index}: {dict(zip(self.get_column_names(), self.index.read_row(row_index)))}"
+
+    def _set_values(self, row_index, values):
+        columns = self.get_column_names()
+        row = self.index.read_row(row_index)
+        for col, val in values.items():
+            row[columns.index(col)] = str(val)
+        start, stop = self.index.row_span(row_index)
+        record = format_record(row)
+        self._splice(start, stop, record)
+        self.index.replaced(row_index, len(record))
+
+
+def _original_row(position, removed):
+    # The position-th row of the file that isn't in the sorted removed list.
+    low, high = position, position + len(removed)
+    while low < high:
+        middle = (low + high) // 2
+        if middle + 1 - bisect.bisect_right(removed, middle) < position + 1:
+            low = middle + 1
+        else:
+            high = middle
+    return low
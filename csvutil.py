@@ -0,0 +1,58 @@
+import os
+import re
+
+# Small helpers shared by the handlers, the row index and the predicates.
+
+
+def file_stamp(path):
+    # (mtime_ns, size) of path, or None when it doesn't exist.
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_row_spec(row_spec, num_rows):
+    if isinstance(row_spec, str):
+        if row_spec.lower() == "last":
+            return num_rows - 1
+        elif row_spec.lower() == "first":
+            return 0
+    return int(row_spec)
+
+
+_NUMBER = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+def coerce_value(value):
+    # Literal values in conditions: numbers become int/float, the rest stays text.
+    text = str(value).strip()
+    if _NUMBER.fullmatch(text):
+        return int(text) if re.fullmatch(r"[+-]?\d+", text) else float(text)
+    return value
+
+
+def parse_row_selection(rows, num_rows):
+    # Accepts an index, 'first'/'last', an inclusive range 'a-b', a
+    # '|'-separated mix of those, or a list of indices.
+    if isinstance(rows, (list, tuple)):
+        parts = list(rows)
+    else:
+        parts = [part.strip() for part in str(rows).split("|") if part.strip()]
+    selected = set()
+    for part in parts:
+        if isinstance(part, str) and "-" in part.strip("-"):
+            start, end = part.split("-", 1)
+            start, end = parse_row_spec(start.strip(), num_rows), parse_row_spec(end.strip(), num_rows)
+            if start > end:
+                raise ValueError(f"Invalid row range '{part}'.")
+            selected.update(range(start, end + 1))
+        else:
+            selected.add(parse_row_spec(part, num_rows))
+    if not selected:
+        raise ValueError("No rows selected.")
+    out_of_range = [index for index in selected if index < 0 or index >= num_rows]
+    if out_of_range:
+        raise ValueError(f"Row index {min(out_of_range)} is out of range (0-{num_rows-1}).")
+    return sorted(selected)
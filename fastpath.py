@@ -0,0 +1,127 @@
+import re
+from columnindex import match_column
+from predicates import predicate_columns
+
+# Plain instructions like "remove row 2" or "set the City value for row 1
+# to San Francisco" are matched against a small grammar and run straight
+# on the handler, skipping the agent and its model calls. Anything that
+# doesn't match a pattern exactly, or names a column or condition that
+# doesn't resolve, returns None and goes to the agent.
+
+_ROW = r"(?P<row>\d+|first|last)"
+
+_PATTERNS = [
+    ("undo", r"undo(?: (?:the )?(?:last )?(?P<steps>\d+)?\s*(?:changes?|edits?))?"),
+    ("redo", r"redo(?: (?:the )?(?:last )?(?P<steps>\d+)?\s*(?:changes?|edits?))?"),
+    ("info", r"(?:show|get|describe|display)(?: me)? (?:the )?(?:csv|data|table|columns|info)(?: info)?"),
+    ("get_row", rf"(?:show|get|display)(?: me)? (?:the )?row {_ROW}"),
+    ("get_row", rf"(?:show|get|display)(?: me)? the (?P<row>first|last) row"),
+    ("delete_where", r"(?:remove|delete|drop) (?:all )?(?:the )?rows? (?:where|with) (?P<condition>.+)"),
+    ("remove_row", rf"(?:remove|delete|drop) (?:the )?row (?:number )?{_ROW}"),
+    ("remove_row", r"(?:remove|delete|drop) the (?P<row>first|last) row"),
+    ("remove_columns", r"(?:remove|delete|drop) (?:the )?columns?:? (?P<columns>.+)"),
+    ("add_column", r"add (?:a |an )?(?:new )?column (?:named |called )?(?P<column>.+?)"
+                   r"(?: with (?:a )?(?:default )?values? (?:of |as |= ?)?(?P<value>.+))?"),
+    ("add_row", r"add (?:a |an )?(?:new )?row (?:with )?(?P<pairs>.+)"),
+    ("update_where", r"(?:set|change|update) (?:the )?(?P<column>.+?) (?:to|=) (?P<value>.+?) "
+                     r"(?:for (?:all )?rows )?where (?P<condition>.+)"),
+    ("set_cell", rf"(?:set|change|update) (?:the )?(?P<column>.+?)(?: value| cell)? (?:for|in|of|at|on) row {_ROW} "
+                 r"to (?P<value>.+)"),
+]
+_PATTERNS = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in _PATTERNS]
+
+# A value like "Bob, Age = 3" is probably more than one edit; the agent
+# sorts those out.
+_COMPOUND = re.compile(r",|=|\band\b", re.IGNORECASE)
+
+_PAIR = re.compile(r"(?P<key>.+?)\s*(?:=|:|\bas\b|\bis\b)\s*(?P<value>.+)", re.IGNORECASE)
+
+
+def _clean(text):
+    text = text.strip()
+    if len(text) > 1 and text[0] == text[-1] and text[0] in "'\"`":
+        return text[1:-1]
+    return text
+
+
+def _split_list(text):
+    return [_clean(part) for part in re.split(r",|\band\b", text) if part.strip()]
+
+
+def _pairs(text):
+    values = {}
+    for part in text.split(","):
+        match = _PAIR.fullmatch(part.strip())
+        if not match:
+            return None
+        values[_clean(match.group("key"))] = _clean(match.group("value"))
+    return values or None
+
+
+def parse_command(text):
+    # Returns (handler method, args) for an instruction the grammar fully
+    # covers, otherwise None.
+    text = re.sub(r"\s+", " ", text.strip().rstrip(".!")).strip()
+    text = re.sub(r"^(?:please )|(?: please)$", "", text, flags=re.IGNORECASE)
+    for name, pattern in _PATTERNS:
+        match = pattern.fullmatch(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+        if name in ("undo", "redo"):
+            return name, (int(groups["steps"] or 1),)
+        if name == "info":
+            return "get_csv_info", ()
+        if name in ("get_row", "remove_row"):
+            return name, (groups["row"].lower(),)
+        if name == "delete_where":
+            return name, (groups["condition"],)
+        if name == "remove_columns":
+            columns = _split_list(groups["columns"])
+            if len(columns) == 1:
+                return "remove_column", (columns[0],)
+            return "apply_batch", ([{"op": "remove_column", "column": column} for column in columns],)
+        if name == "add_column":
+            column = _clean(groups["column"])
+            if groups["value"] is None:
+                return name, (column,)
+            return name, (f"{column} with values={_clean(groups['value'])}",)
+        if name == "add_row":
+            values = _pairs(groups["pairs"])
+            return (name, (values,)) if values else None
+        if name in ("update_where", "set_cell") and _COMPOUND.search(groups["value"]):
+            return None
+        if name == "update_where":
+            return name, (groups["condition"], {_clean(groups["column"]): _clean(groups["value"])})
+        if name == "set_cell":
+            return name, (groups["row"].lower(), _clean(groups["column"]), _clean(groups["value"]))
+    return None
+
+
+def _resolves(method, args, columns):
+    names = []
+    if method in ("remove_column", "set_cell"):
+        names = [args[-2] if method == "set_cell" else args[0]]
+    elif method == "apply_batch":
+        names = [op["column"] for op in args[0]]
+    elif method in ("add_row", "update_where"):
+        names = list(args[-1])
+    if any(match_column(name, columns)[1] for name in names):
+        return False
+    if method in ("delete_where", "update_where"):
+        try:
+            predicate_columns(args[0], columns)
+        except ValueError:
+            return False
+    return True
+
+
+def run_command(handler, text):
+    # Result of the handler call, or None when the agent should take it.
+    parsed = parse_command(text)
+    if parsed is None or not hasattr(handler, parsed[0]):
+        return None
+    method, args = parsed
+    if not _resolves(method, args, handler.get_column_names()):
+        return None
+    return getattr(handler, method)(*args)
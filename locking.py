@@ -0,0 +1,176 @@
+import functools
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows; the in-process lock still applies.
+    fcntl = None
+
+
+class ConcurrentModificationError(Exception):
+    pass
+
+
+class RWLock:
+    # Readers share the lock, a writer holds it alone. Both sides are
+    # reentrant, and the writing thread may also take read locks. Waiting
+    # writers block new readers so writes aren't starved.
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+
+    def owns_write(self):
+        return self._writer == threading.get_ident()
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                while self._writer is not None or (self._writers_waiting and me not in self._readers):
+                    self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers[me] -= 1
+                if not self._readers[me]:
+                    del self._readers[me]
+                self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._writers_waiting += 1
+                while self._writer is not None or any(thread != me for thread in self._readers):
+                    self._cond.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+            self._writer_depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+# Entries go away with the last handler using them.
+_rwlocks = weakref.WeakValueDictionary()
+_rwlocks_guard = threading.Lock()
+
+
+def rwlock_for(path):
+    # One RWLock per file, shared by every handler in the process.
+    key = os.path.abspath(path)
+    with _rwlocks_guard:
+        lock = _rwlocks.get(key)
+        if lock is None:
+            lock = _rwlocks[key] = RWLock()
+        return lock
+
+
+class FileLock:
+    # Advisory flock() on a sidecar file, shared between processes. Holds
+    # are counted so nested and concurrent in-process users map onto one
+    # lock on our file descriptor.
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._guard = threading.Lock()
+        self._shared = 0
+        self._exclusive = 0
+
+    def _flock(self, mode):
+        if fcntl is None:
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, getattr(fcntl, mode))
+
+    def _release(self):
+        if not self._exclusive:
+            self._flock("LOCK_SH" if self._shared else "LOCK_UN")
+
+    def close(self):
+        # Gives the descriptor back; it is reopened if the lock is used again.
+        with self._guard:
+            if self._fd is not None and not self._shared and not self._exclusive:
+                os.close(self._fd)
+                self._fd = None
+
+    def __del__(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+
+    @contextmanager
+    def shared(self):
+        with self._guard:
+            self._shared += 1
+            if self._shared == 1 and not self._exclusive:
+                self._flock("LOCK_SH")
+        try:
+            yield
+        finally:
+            with self._guard:
+                self._shared -= 1
+                self._release()
+
+    @contextmanager
+    def exclusive(self):
+        with self._guard:
+            self._exclusive += 1
+            if self._exclusive == 1:
+                self._flock("LOCK_EX")
+        try:
+            yield
+        finally:
+            with self._guard:
+                self._exclusive -= 1
+                self._release()
+
+
+def read_version(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_version(path, version):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(version))
+    os.replace(tmp_path, path)
+
+
+def reading(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._read_locked():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def writing(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_locked():
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -1,20 +1,37 @@
+import asyncio
+import itertools
+import json
 import os
-from langchain.agents import initialize_agent
-from langchain.agents.agent_types import AgentType
-from langchain_google_genai import ChatGoogleGenerativeAI
+import socket
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
 from dotenv import load_dotenv
 import colorama
 from colorama import Fore, Style, Back
-import time
 from datetime import datetime
-from csvoperations import CSVHandler
-from tools import create_tools, SYSTEM_PROMPT
+
+# Start-up only imports what the prompt needs. pandas, LangChain and the
+# Gemini client are imported by warm_up() on a background thread while the
+# first instruction is typed. With --daemon the warmed-up agent stays
+# running behind a local socket, and later `python main.py` runs connect
+# to it as thin clients that import none of them.
 
 load_dotenv()
 colorama.init()
 
-CSV_PATH = "sample.csv"
+CSV_PATHS = [arg for arg in sys.argv[1:] if not arg.startswith("--")] or ["sample.csv"]
+FLAGS = {arg for arg in sys.argv[1:] if arg.startswith("--")}
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Adds an LLM/tool/parse/save time breakdown under each answer.
+SHOW_TIMINGS = os.getenv("CSV_TIMINGS", "").lower() in {"1", "true", "yes"}
+# The daemon's socket lives in a directory only this user can enter: the
+# session's XDG_RUNTIME_DIR, or a 0700 directory made in the temp dir.
+SOCKET_PATH = os.getenv("CSV_AGENT_SOCKET") or os.path.join(
+    os.getenv("XDG_RUNTIME_DIR") or os.path.join(
+        tempfile.gettempdir(), f"csv-agent-{getattr(os, 'getuid', lambda: 'user')()}"),
+    "csv-agent.sock")
 
 def get_timestamp():
     return datetime.now().strftime("%H:%M:%S")
@@ -22,44 +39,58 @@ def get_timestamp():
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
-def print_header():
+def print_header(note=""):
     clear_screen()
     print(f"{Fore.GREEN}{'CSV AGENT CHAT INTERFACE':^60}{Style.RESET_ALL}")
-    print(f"{Fore.CYAN}📁 Currently working with: {Fore.YELLOW}{CSV_PATH}{Style.RESET_ALL}")
-    print(f"{Fore.CYAN}Type your instructions or 'exit' to quit{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}📁 Currently working with: {Fore.YELLOW}{', '.join(CSV_PATHS)}{Style.RESET_ALL}{note}")
+    print(f"{Fore.CYAN}Type your instructions, 'metrics' for timing totals, or 'exit' to quit{Style.RESET_ALL}")
     print(f"{Fore.CYAN}{'- ' * 30}{Style.RESET_ALL}")
 
-def print_bot_message(message):
+def print_bot_message(message, footer=None):
     timestamp = get_timestamp()
     print(f"\n{Fore.GREEN}[{timestamp}] 🤖 Bot: {Style.RESET_ALL}")
     for line in message.split('\n'):
         print(f"{Fore.CYAN}  {line}{Style.RESET_ALL}")
+    if footer:
+        print(f"{Style.DIM}  ({footer}){Style.RESET_ALL}")
 
 def print_user_message(message):
     timestamp = get_timestamp()
     print(f"\n{Fore.YELLOW}[{timestamp}] 👤 You: {Style.RESET_ALL}")
     print(f"{Fore.WHITE}  {message}{Style.RESET_ALL}")
 
+def turn_footer(path, turn):
+    # Which route answered (the local command parser, the response cache or
+    # the LLM agent), and with CSV_TIMINGS where the time went.
+    label = {"direct": "⚡ direct command, no LLM call",
+             "cache": "♻️ cached answer, the data hasn't changed"}.get(path, "🤖 agent")
+    if SHOW_TIMINGS:
+        return f"{label} · {turn.footer()}"
+    return f"{label}, {turn.seconds:.2f}s"
+
 def print_error(message):
     timestamp = get_timestamp()
     print(f"\n{Fore.RED}[{timestamp}] ❌ Error: {Style.RESET_ALL}")
     print(f"{Fore.RED}  {message}{Style.RESET_ALL}")
 
-def main():
-    if not GEMINI_API_KEY:
-        print_error("GEMINI_API_KEY environment variable not found. Please set it in .env file.")
-        return
-        
-    llm = ChatGoogleGenerativeAI(
+def prompt():
+    return input(f"\n{Fore.YELLOW}🗨️ You: {Style.RESET_ALL}")
+
+def make_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
         model="gemini-2.0-flash",
         google_api_key=GEMINI_API_KEY
     )
 
-    csv_handler = CSVHandler(CSV_PATH)
-    
-    tools = create_tools(csv_handler)
+def make_agent(llm, csv_handler):
+    from langchain.agents import initialize_agent
+    from langchain.agents.agent_types import AgentType
+    from tools import create_tools, create_workspace_tools, SYSTEM_PROMPT
+
+    tools = create_tools(csv_handler) + create_workspace_tools(csv_handler)
 
-    agent = initialize_agent(
+    return initialize_agent(
         tools=tools,
         llm=llm,
         agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
@@ -69,26 +100,308 @@ def main():
         }
     )
 
+def open_session(workspace, session_id, csv_paths):
+    csv_handler = workspace.session(session_id)
+    for csv_path in csv_paths:
+        csv_handler.add(csv_path)
+    # Loads the active CSV and its column profile, which the agent's first
+    # step (GetCSVInfo) reads.
+    csv_handler.get_csv_info()
+    return csv_handler
+
+def warm_up(csv_paths, llm=None):
+    from workspace import Workspace
+    # Imported now so the first turn doesn't pay for them.
+    import fastpath, metrics
+
+    llm = llm or make_llm()
+    csv_handler = open_session(Workspace(), "cli", csv_paths)
+    return make_agent(llm, csv_handler), csv_handler
+
+def in_background(func, *args):
+    # Runs func on a daemon thread; the returned Future holds its result.
+    future = Future()
+    def run():
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, name="csv-agent-warmup", daemon=True).start()
+    return future
+
+def make_cache():
+    # Shared by every turn (and, in the daemon, every client); kept in
+    # SQLite across restarts when CSV_RESPONSE_CACHE_DB is set.
+    from responsecache import ResponseCache
+    return ResponseCache(path=os.getenv("CSV_RESPONSE_CACHE_DB"))
+
+async def run_turn(agent, csv_handler, user_input, thinking=None, cache=None):
+    from fastpath import run_command
+    from metrics import MetricsCallback, trace_turn
+    from responsecache import data_version, tracking_writes
+
+    try:
+        with trace_turn() as turn:
+            # Simple commands run directly; read-only questions asked before
+            # about the same data come from the cache; the agent gets
+            # everything else.
+            response = await asyncio.to_thread(run_command, csv_handler, user_input)
+            path = "direct"
+            if response is None and cache is not None:
+                version = await asyncio.to_thread(data_version, csv_handler)
+                response = cache.get(user_input, version)
+                path = "cache"
+            if response is None:
+                if thinking:
+                    thinking()
+                config = {"callbacks": [MetricsCallback(turn)]}
+                with tracking_writes() as writes:
+                    response = (await agent.ainvoke({"input": user_input}, config=config))["output"]
+                path = "agent"
+                # Only answers from turns that changed nothing are kept.
+                if cache is not None and not writes and await asyncio.to_thread(data_version, csv_handler) == version:
+                    cache.put(user_input, version, response)
+        return response, turn_footer(path, turn)
+    finally:
+        await asyncio.to_thread(csv_handler.flush)
+
+def metrics_text():
+    from metrics import REGISTRY
+    return REGISTRY.prometheus()
+
+def main():
+    if "--stop-daemon" in FLAGS:
+        stop_daemon()
+        return
+    if "--no-daemon" not in FLAGS and "--daemon" not in FLAGS:
+        connection = connect_daemon()
+        if connection is not None:
+            remote_chat(connection)
+            return
+    if not GEMINI_API_KEY:
+        print_error("GEMINI_API_KEY environment variable not found. Please set it in .env file.")
+        return
+    if "--daemon" in FLAGS:
+        asyncio.run(serve(CSV_PATHS))
+        return
+
+    asyncio.run(chat(in_background(warm_up, CSV_PATHS)))
+
+async def chat(warmup):
     print_header()
-    
+    ready = None
+    cache = None
+
     # chat_history = []
-    while True:
-        user_input = input(f"\n{Fore.YELLOW}🗨️ You: {Style.RESET_ALL}")
-        if user_input.lower() in {"exit", "quit"}:
-            print(f"\n{Fore.GREEN}👋 Goodbye!{Style.RESET_ALL}")
-            break
-            
-        # chat_history.append(("user", user_input))
-        
+    try:
+        while True:
+            # input() blocks, so it waits on a thread instead of the event loop.
+            try:
+                user_input = await asyncio.to_thread(prompt)
+            except EOFError:
+                user_input = "exit"
+            if user_input.lower() in {"exit", "quit"}:
+                print(f"\n{Fore.GREEN}👋 Goodbye!{Style.RESET_ALL}")
+                break
+            if user_input.strip().lower() == "metrics":
+                print(f"{Style.DIM}{metrics_text()}{Style.RESET_ALL}")
+                continue
+            if ready is None:
+                if not warmup.done():
+                    print(f"{Style.DIM}  (still loading the agent...){Style.RESET_ALL}")
+                try:
+                    ready = await asyncio.wrap_future(warmup)
+                except Exception as e:
+                    print_error(f"Could not start the agent: {e}")
+                    return
+                cache = make_cache()
+            agent, csv_handler = ready
+
+            # chat_history.append(("user", user_input))
+
+            def thinking():
+                print(f"{Fore.GREEN}🤖 Bot: {Fore.CYAN}Thinking...{Style.RESET_ALL}", end="\r")
+
+            try:
+                response, footer = await run_turn(agent, csv_handler, user_input, thinking, cache)
+                print(" " * 50, end="\r")
+                print_bot_message(response, footer)
+                # chat_history.append(("bot", response))
+            except Exception as e:
+                print_error(str(e))
+                # chat_history.append(("error", str(e)))
+    finally:
+        # Also on Ctrl-C, so edits kept only in the Feather cache reach the
+        # CSV. Nothing can have changed before the agent was ready.
+        if ready is not None:
+            ready[1].export_csv()
+
+# Daemon protocol: one JSON object per line. The client opens with
+# {"csvs": [absolute paths]} and gets {"ready": true}; then each
+# {"input": text} is answered with {"output": text, "footer": text} or
+# {"error": text}. {"metrics": true}, {"exit": true} (exports the CSVs and
+# closes) and {"shutdown": true} (stops the daemon) are also understood.
+
+def owned_by_me(path):
+    return os.stat(path).st_uid == os.getuid()
+
+def private_dir(path):
+    # Creates the socket's directory 0700, or checks that an existing one
+    # is ours and closed to everyone else.
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not os.path.isdir(directory) or os.path.islink(directory) or info.st_uid != os.getuid() \
+            or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} must be a directory owned by you with mode 0700.")
+
+def connect_daemon(path=SOCKET_PATH):
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    # Someone else's socket could read every instruction and forge answers.
+    if not owned_by_me(path):
+        print_error(f"Ignoring {path}: it belongs to another user.")
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+def send(stream, message):
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+def receive(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("The CSV agent daemon closed the connection.")
+    return json.loads(line)
+
+def remote_chat(connection):
+    with connection, connection.makefile("rw", encoding="utf-8") as stream:
         try:
-            print(f"{Fore.GREEN}🤖 Bot: {Fore.CYAN}Thinking...{Style.RESET_ALL}", end="\r")
-            response = agent.invoke({"input": user_input})["output"]
-            print(" " * 50, end="\r") 
-            print_bot_message(response)
-            # chat_history.append(("bot", response))
-        except Exception as e:
+            send(stream, {"csvs": [os.path.abspath(path) for path in CSV_PATHS]})
+            reply = receive(stream)
+            if "error" in reply:
+                print_error(reply["error"])
+                return
+            print_header(f"{Style.DIM} (via daemon){Style.RESET_ALL}")
+            while True:
+                user_input = prompt()
+                if user_input.lower() in {"exit", "quit"}:
+                    send(stream, {"exit": True})
+                    receive(stream)
+                    print(f"\n{Fore.GREEN}👋 Goodbye!{Style.RESET_ALL}")
+                    break
+                if user_input.strip().lower() == "metrics":
+                    send(stream, {"metrics": True})
+                    print(f"{Style.DIM}{receive(stream)['output']}{Style.RESET_ALL}")
+                    continue
+                print(f"{Fore.GREEN}🤖 Bot: {Fore.CYAN}Thinking...{Style.RESET_ALL}", end="\r")
+                send(stream, {"input": user_input})
+                reply = receive(stream)
+                print(" " * 50, end="\r")
+                if "error" in reply:
+                    print_error(reply["error"])
+                else:
+                    print_bot_message(reply["output"], reply.get("footer"))
+        except (ConnectionError, OSError, ValueError) as e:
             print_error(str(e))
-            # chat_history.append(("error", str(e)))
+
+def stop_daemon():
+    connection = connect_daemon()
+    if connection is None:
+        print_error(f"No CSV agent daemon is listening on {SOCKET_PATH}.")
+        return
+    with connection, connection.makefile("rw", encoding="utf-8") as stream:
+        send(stream, {"shutdown": True})
+        stream.readline()
+    print(f"{Fore.GREEN}CSV agent daemon stopped.{Style.RESET_ALL}")
+
+async def serve(csv_paths, path=SOCKET_PATH, llm=None):
+    from workspace import Workspace
+
+    if not hasattr(socket, "AF_UNIX"):
+        print_error("Daemon mode needs Unix domain sockets, which this platform doesn't have.")
+        return
+    try:
+        private_dir(path)
+    except PermissionError as e:
+        print_error(str(e))
+        return
+    if connect_daemon(path) is not None:
+        print_error(f"A CSV agent daemon is already listening on {path}.")
+        return
+    if os.path.exists(path):
+        # Left behind by a daemon that didn't shut down cleanly.
+        os.remove(path)
+
+    # Warmed once and shared by every client: the imports, the LLM client
+    # and the loaded CSVs. Each connection gets its own session and agent.
+    llm = llm or make_llm()
+    workspace = Workspace()
+    await asyncio.to_thread(open_session, workspace, "daemon", csv_paths)
+    cache = make_cache()
+    clients = itertools.count(1)
+    stopped = asyncio.Event()
+
+    async def reply(writer, message):
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+    async def handle(reader, writer):
+        try:
+            hello = json.loads(await reader.readline() or "{}")
+            if not isinstance(hello, dict):
+                await reply(writer, {"error": "Expected a JSON object."})
+                return
+            if hello.get("shutdown"):
+                await reply(writer, {"output": "stopping"})
+                stopped.set()
+                return
+            try:
+                csv_handler = await asyncio.to_thread(
+                    open_session, workspace, f"client-{next(clients)}", hello.get("csvs") or csv_paths)
+                agent = await asyncio.to_thread(make_agent, llm, csv_handler)
+            except Exception as e:
+                await reply(writer, {"error": f"Could not open the CSVs: {e}"})
+                return
+            await reply(writer, {"ready": True})
+            while line := await reader.readline():
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    await reply(writer, {"error": "Expected a JSON object."})
+                    continue
+                if request.get("exit"):
+                    await asyncio.to_thread(csv_handler.export_csv)
+                    await reply(writer, {"output": "bye"})
+                    break
+                if request.get("metrics"):
+                    await reply(writer, {"output": metrics_text()})
+                    continue
+                try:
+                    response, footer = await run_turn(agent, csv_handler, request.get("input", ""), cache=cache)
+                    await reply(writer, {"output": response, "footer": footer})
+                except Exception as e:
+                    await reply(writer, {"error": str(e)})
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, path=path)
+    print(f"{Fore.GREEN}CSV agent daemon listening on {path}{Style.RESET_ALL}")
+    try:
+        async with server:
+            await stopped.wait()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        # Every CSV opened here, including the ones clients asked for.
+        await asyncio.to_thread(workspace.export)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
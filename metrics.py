@@ -0,0 +1,204 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:
+    BaseCallbackHandler = object
+
+# Spans time the steps of an agent turn: LLM calls, tool calls, and CSV
+# parsing and saving. Each finished span goes into the process-wide
+# registry (totals per step, exported as Prometheus text) and into the
+# turn being traced, if any, for a per-turn breakdown. With
+# CSV_METRICS_JSONL set, every span is also appended to that file.
+
+COUNTED = ("rows", "bytes", "input_tokens", "output_tokens")
+
+_turn = contextvars.ContextVar("csv_metrics_turn", default=None)
+
+
+class Registry:
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.totals = defaultdict(lambda: defaultdict(float))
+
+    def record(self, span):
+        with self._lock:
+            totals = self.totals[(span["step"], span["name"])]
+            totals["count"] += 1
+            totals["seconds"] += span["seconds"]
+            for key in COUNTED:
+                totals[key] += span.get(key) or 0
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span, default=str) + "\n")
+
+    def prometheus(self):
+        # Prometheus text exposition format.
+        with self._lock:
+            totals = {key: dict(values) for key, values in self.totals.items()}
+        lines = [
+            "# HELP csv_agent_step_seconds Time spent in each step of an agent turn.",
+            "# TYPE csv_agent_step_seconds summary",
+        ]
+        for (step, name), values in sorted(totals.items()):
+            labels = _labels(step=step, name=name)
+            lines.append(f"csv_agent_step_seconds_count{labels} {int(values['count'])}")
+            lines.append(f"csv_agent_step_seconds_sum{labels} {values['seconds']:.6f}")
+        for key in COUNTED:
+            metric = f"csv_agent_{key}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (step, name), values in sorted(totals.items()):
+                if values.get(key):
+                    lines.append(f"{metric}{_labels(step=step, name=name)} {int(values[key])}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels):
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+REGISTRY = Registry(os.getenv("CSV_METRICS_JSONL"))
+
+
+class Turn:
+    # The spans of one user turn, for the CLI footer and Streamlit expander.
+    def __init__(self):
+        self.spans = []
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    def add(self, span):
+        self.spans.append(span)
+
+    def by_step(self):
+        steps = {}
+        for span in self.spans:
+            entry = steps.setdefault(span["step"], {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += span["seconds"]
+            for key in COUNTED:
+                if span.get(key):
+                    entry[key] = entry.get(key, 0) + span[key]
+        return steps
+
+    def footer(self):
+        parts = []
+        for step, entry in self.by_step().items():
+            text = f"{step} {entry['seconds']:.2f}s"
+            if entry["count"] > 1:
+                text += f" ×{entry['count']}"
+            tokens = entry.get("input_tokens", 0) + entry.get("output_tokens", 0)
+            if tokens:
+                text += f" ({tokens} tokens)"
+            parts.append(text)
+        total = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        parts.append(f"total {total:.2f}s")
+        return " · ".join(parts)
+
+    def rows(self):
+        # One dict per span, in order, for tabular display.
+        return [{"step": span["step"], "name": span["name"], "ms": round(span["seconds"] * 1000, 1),
+                 **{key: span[key] for key in COUNTED if span.get(key)}} for span in self.spans]
+
+
+@contextmanager
+def trace_turn():
+    turn = Turn()
+    token = _turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _turn.reset(token)
+        turn.seconds = time.perf_counter() - turn.started
+
+
+def record(span, turn=None):
+    REGISTRY.record(span)
+    turn = turn or _turn.get()
+    if turn is not None:
+        turn.add(span)
+
+
+@contextmanager
+def span(step, name, **attrs):
+    # Times the block; the caller can add rows/bytes/... to the yielded dict.
+    info = {"step": step, "name": name, **attrs}
+    started = time.perf_counter()
+    info["start"] = time.time()
+    try:
+        yield info
+    finally:
+        info["seconds"] = time.perf_counter() - started
+        record(info)
+
+
+def timed(step, name, func):
+    def wrapper(*args, **kwargs):
+        with span(step, name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class MetricsCallback(BaseCallbackHandler):
+    # LangChain callback recording a span per LLM call with its token
+    # usage. Pass the turn when the callback may run outside its context.
+    def __init__(self, turn=None):
+        super().__init__()
+        self.turn = turn
+        self._started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), time.time())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), time.time())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, None, error=str(error))
+
+    def _finish(self, run_id, response, **attrs):
+        started, start = self._started.pop(run_id, (None, None))
+        if started is None:
+            return
+        info = {"step": "llm", "name": _model_name(response), "start": start,
+                "seconds": time.perf_counter() - started, **attrs, **_token_usage(response)}
+        record(info, self.turn)
+
+
+def _model_name(response):
+    output = getattr(response, "llm_output", None) or {}
+    return output.get("model_name") or output.get("model") or "llm"
+
+
+def _token_usage(response):
+    # Chat models report usage on each message, completion models in
+    # llm_output["token_usage"].
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    if response is None:
+        return usage
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            usage["input_tokens"] += metadata.get("input_tokens", 0)
+            usage["output_tokens"] += metadata.get("output_tokens", 0)
+    if not any(usage.values()):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        usage["input_tokens"] = token_usage.get("prompt_tokens", 0)
+        usage["output_tokens"] = token_usage.get("completion_tokens", 0)
+    return usage
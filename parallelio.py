@@ -0,0 +1,161 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from schema import date_texts, date_witnesses
+
+# Multi-core read_csv/to_csv for large files. Reads split the file into
+# byte ranges that start and end on row boundaries (a newline with an even
+# number of quotes before it, so quoted newlines never split a row), parse
+# them in a process pool and concatenate the pieces in order; with
+# engine="pyarrow" pandas' pyarrow reader parses on its own threads
+# instead. With engine="processes", writes format row chunks in the pool
+# and write the text in order, through a large buffer; pyarrow can't write
+# pandas' text, so with engine="pyarrow" writes stay serial. Files (and
+# frames, by their size in memory) under MIN_BYTES aren't worth the pool's
+# overhead and use pandas directly.
+
+ENGINES = ("processes", "pyarrow")
+DEFAULT_ENGINE = os.getenv("CSV_PARALLEL_IO") or None
+DEFAULT_WORKERS = int(os.getenv("CSV_IO_WORKERS", os.cpu_count() or 1))
+MIN_BYTES = int(os.getenv("CSV_PARALLEL_MIN_BYTES", 32 * 1024 * 1024))
+WRITE_BUFFER = 8 * 1024 * 1024
+# Pieces per worker, so one slow range doesn't hold up the rest.
+SPLIT_FACTOR = 4
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pool_failed = False
+
+
+def pool(workers):
+    # Spawned rather than forked: the handlers' threads and locks mustn't
+    # be copied into the workers. Pools live as long as the process.
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pools[workers]
+
+
+def _serial(engine, workers):
+    return engine not in ENGINES or workers < 2
+
+
+def _pool_broken(workers):
+    # Spawned workers re-import __main__, which fails under `python -` or a
+    # script without a __main__ guard; everything stays serial after that.
+    global _pool_failed
+    with _pools_lock:
+        _pool_failed = True
+        broken = _pools.pop(workers, None)
+    if broken is not None:
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+def split_ranges(csv_path, parts):
+    # [(start, end)] byte ranges covering the rows after the header.
+    size = os.path.getsize(csv_path)
+    bounds = []
+    quotes = 0
+    with open(csv_path, "rb") as f:
+        pos = _row_end(f, 0, 0)[0]
+        bounds.append(pos)
+        for i in range(1, parts):
+            target = bounds[0] + (size - bounds[0]) * i // parts
+            if target <= pos:
+                continue
+            f.seek(pos)
+            while pos < target:
+                block = f.read(min(WRITE_BUFFER, target - pos))
+                quotes += block.count(b'"')
+                pos += len(block)
+            pos, quotes = _row_end(f, pos, quotes)
+            if pos >= size:
+                break
+            bounds.append(pos)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _row_end(f, pos, quotes):
+    # First position at or after pos that follows a newline outside quotes.
+    f.seek(pos)
+    while line := f.readline():
+        quotes += line.count(b'"')
+        pos += len(line)
+        if quotes % 2 == 0:
+            break
+    return pos, quotes
+
+
+def _read_range(csv_path, start, end, names, kwargs):
+    with open(csv_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return pd.read_csv(io.BytesIO(data), header=None, names=names, **kwargs)
+
+
+def read_csv(csv_path, engine=DEFAULT_ENGINE, workers=DEFAULT_WORKERS, **kwargs):
+    # pd.read_csv(csv_path, **kwargs) on several cores; kwargs are limited
+    # to the ones that apply per row (usecols, dtype, parse_dates, ...).
+    if _serial(engine, workers) or os.path.getsize(csv_path) < MIN_BYTES:
+        return pd.read_csv(csv_path, **kwargs)
+    if engine == "pyarrow":
+        return pd.read_csv(csv_path, engine="pyarrow", **kwargs)
+    if _pool_failed:
+        return pd.read_csv(csv_path, **kwargs)
+    original = dict(kwargs)
+    names = list(pd.read_csv(csv_path, nrows=0).columns)
+    # Categories differ from piece to piece, so pieces are read as text
+    # and the column is made categorical once they're joined.
+    dtype = kwargs.get("dtype") or {}
+    categorical = [col for col, name in dtype.items() if name == "category"]
+    if categorical:
+        kwargs["dtype"] = {col: "str" if name == "category" else name for col, name in dtype.items()}
+    ranges = split_ranges(csv_path, workers * SPLIT_FACTOR)
+    if not ranges:
+        return pd.read_csv(csv_path, **kwargs)
+    try:
+        futures = [pool(workers).submit(_read_range, csv_path, start, end, names, kwargs) for start, end in ranges]
+        df = pd.concat([future.result() for future in futures], ignore_index=True)
+    except BrokenProcessPool:
+        _pool_broken(workers)
+        return pd.read_csv(csv_path, **original)
+    for col in categorical:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _format_rows(df, header, witnesses):
+    for col, witness in witnesses.items():
+        df[col] = date_texts(df[col], witness)
+    return df.to_csv(index=False, header=header)
+
+
+def to_csv(df, csv_path, engine=DEFAULT_ENGINE, workers=DEFAULT_WORKERS):
+    # df.to_csv(csv_path, index=False) with the text formatted on several
+    # cores; the output is the same text.
+    if _serial(engine, workers) or engine != "processes" or _pool_failed \
+            or df.memory_usage(index=False, deep=True).sum() < MIN_BYTES:
+        df.to_csv(csv_path, index=False)
+        return
+    step = -(-len(df) // (workers * SPLIT_FACTOR))
+    witnesses = date_witnesses(df)
+    try:
+        executor = pool(workers)
+        pending = []
+        with open(csv_path, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+            for start in range(0, len(df), step):
+                pending.append(executor.submit(_format_rows, df.iloc[start:start + step], start == 0, witnesses))
+                # Formatted text waits in memory for at most two rounds.
+                if len(pending) >= 2 * workers:
+                    f.write(pending.pop(0).result())
+            for future in pending:
+                f.write(future.result())
+    except BrokenProcessPool:
+        _pool_broken(workers)
+        df.to_csv(csv_path, index=False)
@@ -0,0 +1,240 @@
+import re
+import pandas as pd
+from columnindex import match_column
+from csvutil import coerce_value
+from schema import coerce_scalar, dtype_name
+
+# Conditions like:  country = US and (age >= 30 or city in (Paris, 'New York'))
+# are compiled straight into a boolean mask over the whole frame, so every
+# comparison is a single vectorized pandas operation.
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<name>`[^`]*`)
+  | (?P<op>==|!=|<>|>=|<=|=|>|<)
+  | (?P<punct>[(),\[\]])
+  | (?P<word>[^\s'"`()\[\],=!<>]+)
+)""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "in", "contains", "is", "empty"}
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"Unexpected character '{text[pos]}' in condition.")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1].replace("\\" + value[0], value[0])
+        elif kind == "name":
+            kind, value = "string", value[1:-1]
+        elif kind == "word" and value.lower() in _KEYWORDS:
+            kind, value = "keyword", value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text, df):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.df = df
+        self.columns_used = []
+
+    def peek(self, offset=0):
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        kind, token = self.take()
+        if token != value:
+            raise ValueError(f"Expected '{value}' in condition.")
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Condition is empty.")
+        mask = self.parse_or()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.peek()[1]}' in condition.")
+        return mask
+
+    def parse_or(self):
+        mask = self.parse_and()
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            mask = mask | self.parse_and()
+        return mask
+
+    def parse_and(self):
+        mask = self.parse_not()
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            mask = mask & self.parse_not()
+        return mask
+
+    def parse_not(self):
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            return ~self.parse_not()
+        if self.peek() == ("punct", "("):
+            self.take()
+            mask = self.parse_or()
+            self.expect(")")
+            return mask
+        return self.parse_comparison()
+
+    def words(self, stop_keywords):
+        # Bare words are joined so unquoted names and values may contain
+        # spaces, e.g. "customer id = San Francisco".
+        parts = []
+        while True:
+            kind, value = self.peek()
+            if kind in ("word", "string") or (kind == "keyword" and value not in stop_keywords):
+                parts.append(value)
+                self.take()
+            else:
+                break
+        if not parts:
+            raise ValueError("Expected a column name or value in condition.")
+        return " ".join(parts)
+
+    def parse_comparison(self):
+        column, error = match_column(self.words({"in", "contains", "is", "not", "and", "or"}), self.df.columns)
+        if error:
+            raise ValueError(error)
+        if column not in self.columns_used:
+            self.columns_used.append(column)
+        series = self.df[column]
+        kind, op = self.take()
+        if op == "not" and self.peek() == ("keyword", "in"):
+            self.take()
+            return ~series_isin(series, self.parse_list())
+        if op == "in":
+            return series_isin(series, self.parse_list())
+        if op == "contains":
+            text = self.words({"and", "or"})
+            return series.astype(str).str.contains(text, case=False, regex=False, na=False)
+        if op == "is":
+            negate = self.peek() == ("keyword", "not")
+            if negate:
+                self.take()
+            self.expect("empty")
+            mask = series.isna() | (series.astype(str).str.strip() == "")
+            return ~mask if negate else mask
+        if kind != "op":
+            raise ValueError(f"Expected a comparison after '{column}'.")
+        return compare(series, op, self.words({"and", "or"}))
+
+    def parse_list(self):
+        if self.peek() in (("punct", "("), ("punct", "[")):
+            close = ")" if self.take()[1] == "(" else "]"
+            values = []
+            while True:
+                values.append(self.words({"and", "or"}))
+                kind, token = self.take()
+                if token == close:
+                    return values
+                if token != ",":
+                    raise ValueError(f"Expected ',' or '{close}' in value list.")
+        return [value.strip() for value in self.words({"and", "or"}).split("|")]
+
+
+def _numeric(series):
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series
+    return pd.to_numeric(series, errors="coerce")
+
+
+def _typed(series, raw_value):
+    # The literal as a value of the column's dtype (a bool for a boolean
+    # column, a Timestamp for a date column), or None when the column holds
+    # text or the literal doesn't fit.
+    dtype = dtype_name(series)
+    if dtype in ("string", "category"):
+        return None
+    try:
+        value = coerce_scalar(raw_value, dtype)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(value) else value
+
+
+def compare(series, op, raw_value):
+    value = coerce_value(raw_value)
+    if isinstance(value, (int, float)):
+        numbers = _numeric(series)
+        if op in ("=", "=="):
+            return numbers == value
+        if op in ("!=", "<>"):
+            # Missing values differ from everything, as they do as text.
+            return (numbers != value).fillna(True)
+        left = numbers
+    elif (typed := _typed(series, raw_value)) is not None:
+        if op in ("=", "=="):
+            return series == typed
+        if op in ("!=", "<>"):
+            return (series != typed).fillna(True)
+        left, value = series, typed
+    else:
+        # Text matches ignoring case, like contains.
+        if op in ("=", "=="):
+            return series.astype(str).str.lower() == str(raw_value).lower()
+        if op in ("!=", "<>"):
+            return series.astype(str).str.lower() != str(raw_value).lower()
+        left = series.astype(str)
+    if op == ">":
+        return (left > value).fillna(False)
+    if op == ">=":
+        return (left >= value).fillna(False)
+    if op == "<":
+        return (left < value).fillna(False)
+    if op == "<=":
+        return (left <= value).fillna(False)
+    raise ValueError(f"Unknown comparison '{op}'.")
+
+
+def series_isin(series, values):
+    numbers = [coerce_value(value) for value in values]
+    if all(isinstance(value, (int, float)) for value in numbers):
+        return _numeric(series).isin(numbers)
+    typed = [_typed(series, value) for value in values]
+    if all(value is not None for value in typed):
+        return series.isin(typed).fillna(False)
+    return series.astype(str).str.lower().isin([str(value).lower() for value in values])
+
+
+def evaluate_predicate(predicate, df):
+    return _Parser(predicate, df).parse().fillna(False).astype(bool)
+
+
+def predicate_columns(predicate, columns):
+    # Columns a condition refers to, so scans can read only those.
+    parser = _Parser(predicate, pd.DataFrame(columns=list(columns)))
+    parser.parse()
+    return parser.columns_used
+
+
+def split_condition(input_str):
+    # Splits 'condition: key=value, ...' on the first ':' outside quotes.
+    quote = None
+    for i, char in enumerate(input_str):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+        elif char == ":":
+            return input_str[:i].strip(), input_str[i + 1:].strip()
+    raise ValueError("Expected 'condition: key=value, ...'.")
@@ -0,0 +1,266 @@
+import re
+import pandas as pd
+from columnindex import match_column
+from predicates import evaluate_predicate, predicate_columns
+
+# Read-only queries written as ';'-separated clauses, e.g.
+#   where country = US; group by city; agg mean(salary), count(*); sort by mean_salary desc; limit 5
+
+MAX_RESULT_ROWS = 20
+MAX_RESULT_CHARS = 2000
+
+AGGREGATES = {
+    "count": "count",
+    "sum": "sum",
+    "mean": "mean",
+    "avg": "mean",
+    "min": "min",
+    "max": "max",
+    "median": "median",
+    "nunique": "nunique",
+    "distinct": "nunique",
+}
+
+_AGG = re.compile(r"^(\w+)\s*\(\s*(.*?)\s*\)$")
+
+
+def _split_list(text):
+    return [part.strip() for part in text.split(",") if part.strip()]
+
+
+def parse_query(spec, columns):
+    query = {"where": None, "columns": [], "group_by": [], "aggregates": [], "sort": [], "limit": None}
+    for clause in spec.split(";"):
+        clause = clause.strip()
+        if not clause:
+            continue
+        keyword, _, rest = clause.partition(" ")
+        keyword = keyword.lower()
+        rest = rest.strip()
+        if keyword in ("group", "sort", "order") and rest.lower().startswith("by "):
+            rest = rest[3:].strip()
+        if keyword == "where":
+            query["where"] = rest
+        elif keyword in ("columns", "select"):
+            query["columns"] = [_column(name, columns) for name in _split_list(rest)]
+        elif keyword == "group":
+            query["group_by"] = [_column(name, columns) for name in _split_list(rest)]
+        elif keyword == "agg":
+            for item in _split_list(rest):
+                match = _AGG.match(item)
+                if not match or match.group(1).lower() not in AGGREGATES:
+                    raise ValueError(f"Invalid aggregate '{item}'. Use e.g. mean(salary) or count(*).")
+                func = AGGREGATES[match.group(1).lower()]
+                column = None if match.group(2) in ("", "*") else _column(match.group(2), columns)
+                if column is None and func != "count":
+                    raise ValueError(f"Aggregate '{item}' needs a column.")
+                name = func if column is None else f"{func}_{column}"
+                query["aggregates"].append((name, func, column))
+        elif keyword in ("sort", "order"):
+            for item in _split_list(rest):
+                parts = item.split()
+                descending = len(parts) > 1 and parts[-1].lower() == "desc"
+                if len(parts) > 1 and parts[-1].lower() in ("asc", "desc"):
+                    parts = parts[:-1]
+                query["sort"].append((" ".join(parts), descending))
+        elif keyword in ("limit", "top"):
+            query["limit"] = int(rest)
+        else:
+            raise ValueError(f"Unknown clause '{clause}'. Use where, columns, group by, agg, sort by or limit.")
+    if query["group_by"] and not query["aggregates"]:
+        query["aggregates"].append(("count", "count", None))
+    return query
+
+
+def _column(name, columns):
+    column, error = match_column(name, columns)
+    if error:
+        raise ValueError(error)
+    return column
+
+
+def needed_columns(query, columns):
+    # Columns a scan has to read; None means all of them.
+    if not query["columns"] and not query["aggregates"]:
+        return None
+    needed = list(query["columns"]) + list(query["group_by"])
+    needed += [column for _, _, column in query["aggregates"] if column]
+    if query["where"]:
+        needed += predicate_columns(query["where"], columns)
+    needed += [key for key, _ in query["sort"] if key in columns]
+    return [column for column in columns if column in needed] or columns[:1]
+
+
+def filter_frame(df, query):
+    if query["where"]:
+        df = df[evaluate_predicate(query["where"], df)]
+    return df
+
+
+def aggregate_frame(df, query):
+    if query["aggregates"]:
+        if query["group_by"]:
+            work = df[query["group_by"]].copy()
+            named = {}
+            for name, func, column in query["aggregates"]:
+                if column is None:
+                    work[name] = 1
+                    named[name] = (name, "size")
+                else:
+                    work[name] = _for_aggregate(df[column], func)
+                    named[name] = (name, func)
+            df = work.groupby(query["group_by"], dropna=False, observed=True).agg(**named).reset_index()
+        else:
+            row = {}
+            for name, func, column in query["aggregates"]:
+                row[name] = len(df) if column is None else _for_aggregate(df[column], func).agg(func)
+            df = pd.DataFrame([row])
+    return df
+
+
+def sort_frame(df, query):
+    if query["sort"]:
+        keys = []
+        for key, _ in query["sort"]:
+            if key not in df.columns:
+                key = _column(key, list(df.columns))
+            keys.append(key)
+        ascending = [not descending for _, descending in query["sort"]]
+        values = _sortable(df[keys[0]])
+        if query["limit"] is not None and len(keys) == 1 and pd.api.types.is_numeric_dtype(values):
+            # Top-k without sorting everything.
+            picked = values.nsmallest(query["limit"]) if ascending[0] else values.nlargest(query["limit"])
+            return df.loc[picked.index]
+        df = df.sort_values(keys, ascending=ascending, key=_sortable)
+    if query["limit"] is not None:
+        df = df.head(query["limit"])
+    return df
+
+
+def _for_aggregate(series, func):
+    if func in ("count", "nunique") or pd.api.types.is_numeric_dtype(series):
+        return series
+    if func in ("min", "max") and pd.api.types.is_datetime64_any_dtype(series):
+        # to_numeric would turn the dates into nanoseconds.
+        return series
+    numbers = pd.to_numeric(series, errors="coerce")
+    # A column with no values at all (e.g. in one chunk of a scan) counts
+    # as numbers too, so chunks combine.
+    return numbers if numbers.notna().any() or series.isna().all() else series
+
+
+def _sortable(series):
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    numbers = pd.to_numeric(series, errors="coerce")
+    return numbers if numbers.notna().all() else series
+
+
+def run_query(df, query):
+    df = filter_frame(df, query)
+    if query["aggregates"]:
+        return sort_frame(aggregate_frame(df, query), query)
+    df = sort_frame(df, query)
+    return df[query["columns"]] if query["columns"] else df
+
+
+def scan_query(chunks, query, max_rows=MAX_RESULT_ROWS):
+    # Streams chunks that were read with only the needed columns, filtering
+    # each one as it arrives, and returns (result, number of result rows).
+    # Nothing proportional to the file is kept: aggregates are combined
+    # from per-chunk partial results, and plain queries keep only the rows
+    # that will be shown plus a count of the rest.
+    chunks = (filter_frame(chunk, query) for chunk in chunks)
+    if query["aggregates"]:
+        result = _aggregate_chunks(chunks, query)
+        return result, len(result)
+    # Only the first max_rows rows of the result are shown, so sorted
+    # queries keep the top max_rows and unsorted ones the first max_rows.
+    cap = max_rows if query["limit"] is None else min(query["limit"], max_rows)
+    top = {**query, "where": None, "limit": cap}
+    kept = None
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        kept = chunk if kept is None else pd.concat([kept, chunk], ignore_index=True)
+        kept = sort_frame(kept, top) if query["sort"] else kept.head(cap)
+        if query["limit"] is not None and not query["sort"] and total >= query["limit"]:
+            break
+    if kept is None:
+        return pd.DataFrame(), 0
+    if query["limit"] is not None:
+        total = min(total, query["limit"])
+    return (kept[query["columns"]] if query["columns"] else kept), total
+
+
+def _states(name, func, column):
+    # (state column, source column, per-chunk function, combining function)
+    # for the partial results an aggregate is built from.
+    if column is None:
+        return [(name, None, "sum", "sum")]
+    if func == "mean":
+        return [(name + " sum", column, "sum", "sum"), (name + " count", column, "count", "sum")]
+    return [(name, column, func, "sum" if func == "count" else func)]
+
+
+def _reduce(df, keys, named):
+    if keys:
+        return df.groupby(keys, dropna=False, observed=True).agg(**named).reset_index()
+    return pd.DataFrame([{name: df[source].agg(func) for name, (source, func) in named.items()}])
+
+
+def _aggregate_chunks(chunks, query):
+    # Counts and sums add up across chunks, min and max are the min and max
+    # of the chunks' results, and a mean is the summed sum over the summed
+    # count. median and nunique can't be combined that way; they keep the
+    # values of their column (nunique only the distinct ones).
+    keys = query["group_by"]
+    states = [state for name, func, column in query["aggregates"] if func in ("count", "sum", "mean", "min", "max")
+              for state in _states(name, func, column)]
+    held = [(name, func, column) for name, func, column in query["aggregates"] if func in ("median", "nunique")]
+    combine = {state: (state, combine_func) for state, _, _, combine_func in states}
+    partial = None
+    values = {name: None for name, _, _ in held}
+    for chunk in chunks:
+        if states:
+            work = chunk[keys].copy()
+            for state, column, func, _ in states:
+                work[state] = 1 if column is None else _for_aggregate(chunk[column], func)
+            reduced = _reduce(work, keys, {state: (state, func) for state, _, func, _ in states})
+            partial = reduced if partial is None else _reduce(pd.concat([partial, reduced], ignore_index=True),
+                                                             keys, combine)
+        for name, func, column in held:
+            kept = chunk[keys].copy()
+            kept[name] = _for_aggregate(chunk[column], func)
+            if values[name] is not None:
+                kept = pd.concat([values[name], kept], ignore_index=True)
+            values[name] = kept.drop_duplicates() if func == "nunique" else kept
+    if partial is None and not any(value is not None for value in values.values()):
+        return pd.DataFrame()
+    result = None
+    if partial is not None:
+        result = partial
+        for name, func, column in query["aggregates"]:
+            if func == "mean":
+                result[name] = result[name + " sum"] / result[name + " count"]
+    for name, func, column in held:
+        reduced = _reduce(values[name], keys, {name: (name, func)})
+        if result is None:
+            result = reduced
+        elif keys:
+            result = result.merge(reduced, on=keys, how="outer")
+        else:
+            result[name] = reduced[name].iloc[0]
+    result = result[keys + [name for name, _, _ in query["aggregates"]]]
+    return sort_frame(result, query)
+
+
+def render_result(result, max_rows=MAX_RESULT_ROWS, max_chars=MAX_RESULT_CHARS, total=None):
+    # total is the full row count when result holds only the first rows.
+    total = len(result) if total is None else total
+    text = result.head(max_rows).to_string(index=False)
+    if len(text) > max_chars:
+        text = text[:max_chars] + "\n... (output truncated)"
+    if total > max_rows:
+        text += f"\n... showing {max_rows} of {total} rows"
+    return f"{total} row(s):\n{text}"
@@ -0,0 +1,156 @@
+import contextvars
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Answers to read-only questions ("how many rows?"), keyed on the
+# normalized question and the handler's data_version, so asking again
+# skips the agent until the data changes. A turn in which a writing tool
+# ran is never stored, and writing tools drop the cached answers for their
+# CSV. Entries are evicted least recently used first and expire after ttl
+# seconds; with a path they are kept in SQLite and survive restarts.
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("CSV_RESPONSE_CACHE_SIZE", 256))
+DEFAULT_TTL = float(os.getenv("CSV_RESPONSE_CACHE_TTL", 3600))
+
+_writes = contextvars.ContextVar("csv_response_cache_writes", default=None)
+_caches = weakref.WeakSet()
+
+
+def normalize_prompt(text):
+    return " ".join(re.sub(r"[?!.\s]+$", "", str(text).strip().lower()).split())
+
+
+def data_version(handler):
+    # None for handlers that can't say when their data changes.
+    try:
+        return getattr(handler, "data_version", None)
+    except ValueError:
+        # A session with no CSV open.
+        return None
+
+
+def note_write(scope=None):
+    # Called by writing tools: the running turn isn't cached, and answers
+    # about scope (a CSV path, or everything when None) are dropped.
+    writes = _writes.get()
+    if writes is not None:
+        writes.append(scope)
+    for cache in list(_caches):
+        cache.invalidate(scope)
+
+
+def writing_tool(handler, func):
+    def wrapper(*args, **kwargs):
+        try:
+            scope = os.path.abspath(handler.csv_path)
+        except (AttributeError, ValueError):
+            scope = None
+        note_write(scope)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def tracking_writes():
+    # Yields the list of scopes written during the block.
+    writes = []
+    token = _writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _writes.reset(token)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, scope TEXT, "
+                             "response TEXT, expires REAL, used REAL)")
+            self._db.commit()
+        _caches.add(self)
+
+    def _key(self, prompt, version):
+        return json.dumps([normalize_prompt(prompt), version], default=str)
+
+    def get(self, prompt, version):
+        if version is None:
+            return None
+        key = self._key(prompt, version)
+        now = time.time()
+        with self._lock:
+            if self._db is not None:
+                row = self._db.execute("SELECT response, expires FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] < now:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+                elif row is not None:
+                    self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                response = row[0] if row else None
+            else:
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] < now:
+                    del self._entries[key]
+                    entry = None
+                elif entry is not None:
+                    self._entries.move_to_end(key)
+                response = entry[1] if entry else None
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+    def put(self, prompt, version, response):
+        if version is None:
+            return
+        key = self._key(prompt, version)
+        scope = str(version[0])
+        now = time.time()
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                 (key, scope, response, now + self.ttl, now))
+                self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                                 "ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                self._db.commit()
+                return
+            self._entries[key] = (scope, response, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scope=None):
+        with self._lock:
+            if self._db is not None:
+                if scope is None:
+                    self._db.execute("DELETE FROM responses")
+                else:
+                    self._db.execute("DELETE FROM responses WHERE scope = ?", (str(scope),))
+                self._db.commit()
+            elif scope is None:
+                self._entries.clear()
+            else:
+                for key in [key for key, entry in self._entries.items() if entry[0] == str(scope)]:
+                    del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            if self._db is not None:
+                return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return len(self._entries)
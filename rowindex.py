@@ -0,0 +1,147 @@
+import csv
+import io
+import os
+import numpy as np
+from csvutil import file_stamp
+
+BLOCK_SIZE = 1 << 24
+_HEADER = np.dtype([("mtime_ns", "<i8"), ("size", "<i8")])
+
+
+def scan_row_offsets(path, block_size=BLOCK_SIZE):
+    # Returns the byte offset where each data row starts, followed by one
+    # sentinel offset for the end of the last row. Newlines inside quoted
+    # fields are told apart by the parity of the running quote count, and
+    # blank lines are skipped the same way pandas skips them.
+    ends = []
+    after_cr = []
+    parity = 0
+    last_byte = 0
+    base = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            buf = np.frombuffer(block, dtype=np.uint8)
+            quotes = np.cumsum(buf == ord('"'), dtype=np.int64) + parity
+            newlines = np.flatnonzero(buf == ord("\n"))
+            row_ends = newlines[(quotes[newlines] & 1) == 0]
+            before = np.where(row_ends > 0, buf[np.maximum(row_ends - 1, 0)], last_byte)
+            ends.append(row_ends + base)
+            after_cr.append(before == ord("\r"))
+            parity = int(quotes[-1] & 1)
+            last_byte = buf[-1]
+            base += len(buf)
+
+    ends = np.concatenate(ends) if ends else np.empty(0, dtype=np.int64)
+    after_cr = np.concatenate(after_cr) if after_cr else np.empty(0, dtype=bool)
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64) if len(ends) else ends
+    stops = ends + 1
+    lengths = stops - starts
+    blank = (lengths == 1) | ((lengths == 2) & after_cr)
+    if base > (stops[-1] if len(stops) else 0):
+        # Last row has no trailing newline.
+        starts = np.append(starts, stops[-1] if len(stops) else 0)
+        stops = np.append(stops, base)
+        blank = np.append(blank, False)
+    starts, stops = starts[~blank], stops[~blank]
+    if len(starts) == 0:
+        return np.zeros(1, dtype=np.int64)
+    # The first record is the header.
+    return np.append(starts[1:], stops[-1]).astype(np.int64)
+
+
+class RowIndex:
+    # Byte offsets of every data row, persisted next to the CSV in
+    # <csv>.idx and tagged with the CSV's mtime/size so a stale index is
+    # rebuilt instead of trusted.
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.index_path = csv_path + ".idx"
+        self.offsets = None
+        self.dirty = False
+        self._stamp = None
+
+    def load(self):
+        stamp = file_stamp(self.csv_path)
+        if self.offsets is not None and stamp == self._stamp:
+            return self
+        self._stamp = stamp
+        try:
+            header = np.fromfile(self.index_path, dtype=_HEADER, count=1)
+            if len(header) and stamp is not None and tuple(header[0]) == stamp:
+                self.offsets = np.fromfile(self.index_path, dtype="<i8", offset=_HEADER.itemsize)
+                self.dirty = False
+                return self
+        except (FileNotFoundError, ValueError):
+            pass
+        self.offsets = scan_row_offsets(self.csv_path) if stamp else np.zeros(1, dtype=np.int64)
+        self.dirty = True
+        return self
+
+    def save(self):
+        if not self.dirty or self.offsets is None:
+            return
+        stamp = file_stamp(self.csv_path)
+        if stamp is None:
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.array([stamp], dtype=_HEADER).tofile(f)
+            self.offsets.astype("<i8").tofile(f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+    def invalidate(self):
+        self.offsets = None
+
+    @property
+    def count(self):
+        return len(self.load().offsets) - 1
+
+    def row_span(self, index):
+        offsets = self.load().offsets
+        return int(offsets[index]), int(offsets[index + 1])
+
+    def read_row_bytes(self, index):
+        start, stop = self.row_span(index)
+        with open(self.csv_path, "rb") as f:
+            f.seek(start)
+            return f.read(stop - start)
+
+    def read_row(self, index):
+        return _parse_record(self.read_row_bytes(index))
+
+    # The methods below keep the in-memory index in step with edits the
+    # handler made to the file itself, so it never has to rescan.
+    def _touched(self):
+        self._stamp = file_stamp(self.csv_path)
+        self.dirty = True
+
+    def appended(self, start, stop):
+        self.offsets[-1] = start
+        self.offsets = np.append(self.offsets, stop)
+        self._touched()
+
+    def deleted(self, index):
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        self.offsets = np.delete(self.offsets, index)
+        self.offsets[index:] -= stop - start
+        self._touched()
+
+    def replaced(self, index, new_length):
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        self.offsets[index + 1:] += new_length - (stop - start)
+        self._touched()
+
+
+def _parse_record(data):
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+    return rows[0] if rows else []
+
+
+def format_record(values):
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerow(values)
+    return out.getvalue().encode("utf-8")
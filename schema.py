@@ -0,0 +1,278 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Column dtypes are kept in a <csv>.schema.json sidecar so every load
+# parses straight into the same types instead of letting pandas guess:
+# nullable Int64 for whole numbers (even with blanks), category for
+# repetitive text, datetimes for ISO dates. Writes are coerced to the
+# column's dtype instead of upcasting it to object.
+
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MAX_RATIO = 0.5
+
+_ISO_DATE = r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?"
+_BOOLEANS = {"true": True, "false": False, "yes": True, "no": False}
+_KINDS = {"Int64": "whole number", "float64": "number", "boolean": "true/false value"}
+_INTEGER = re.compile(r"[+-]?\d+")
+_FLOAT = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_MISSING = {"string": pd.NA, "category": np.nan, "Int64": pd.NA, "float64": np.nan, "boolean": pd.NA}
+
+
+def schema_path(csv_path):
+    return csv_path + ".schema.json"
+
+
+def load_schema(csv_path):
+    try:
+        with open(schema_path(csv_path), encoding="utf-8") as f:
+            return json.load(f)["columns"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def save_schema(csv_path, schema):
+    path = schema_path(csv_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"columns": schema}, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def dtype_name(series):
+    return _dtype_name(series.dtype)
+
+
+def _dtype_name(dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return "category"
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "Int64"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float64"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime64[ns]" if getattr(dtype, "tz", None) is None else str(dtype)
+    return "string"
+
+
+def schema_of(df):
+    return {col: _dtype_name(dtype) for col, dtype in df.dtypes.items()}
+
+
+def infer_dtype(series):
+    # Picks the dtype for a column pandas read with its default inference.
+    if pd.api.types.is_float_dtype(series.dtype) and series.isna().any():
+        # Whole numbers with blanks come back as floats.
+        values = series.dropna()
+        if (values % 1 == 0).all():
+            return "Int64"
+    if pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype):
+        values = series.dropna().astype(str)
+        values = values[values.str.strip() != ""]
+        if values.empty:
+            return "string"
+        if values.str.fullmatch(_ISO_DATE).all():
+            return "datetime64[ns]"
+        if values.str.lower().isin(["true", "false"]).all():
+            return "boolean"
+        unique = values.nunique()
+        if unique <= CATEGORY_MAX_UNIQUE and unique <= CATEGORY_MAX_RATIO * len(series):
+            return "category"
+        return "string"
+    return dtype_name(series)
+
+
+def apply_schema(df, schema):
+    for col, dtype in schema.items():
+        if col in df.columns and str(df[col].dtype) != dtype:
+            df[col] = coerce_values(df[col], dtype, col)
+    return df
+
+
+def read_typed_csv(csv_path, usecols=None, read_csv=pd.read_csv):
+    # Reads with the sidecar's dtypes when it matches the file's header,
+    # otherwise infers them once and writes the sidecar for next time.
+    # read_csv parses the rows (parallelio.read_csv for large files).
+    schema = load_schema(csv_path)
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    if schema is not None and list(schema) == header:
+        wanted = [col for col in header if usecols is None or col in usecols]
+        # Numbers parse fastest natively and are cast after; text columns
+        # go straight into their string/categorical arrays.
+        dates = [col for col in wanted if schema[col].startswith("datetime")]
+        dtypes = {col: schema[col] for col in wanted if schema[col] in ("string", "category", "boolean")}
+        try:
+            df = read_csv(csv_path, usecols=usecols, dtype=dtypes, parse_dates=dates, date_format="ISO8601")
+            return apply_schema(df, {col: schema[col] for col in wanted})
+        except (TypeError, ValueError):
+            # The file was edited outside the agent; infer again.
+            pass
+    df = read_csv(csv_path)
+    schema = {col: infer_dtype(df[col]) for col in df.columns}
+    try:
+        df = apply_schema(df, schema)
+    except ValueError:
+        schema = schema_of(df)
+    save_schema(csv_path, schema)
+    return df if usecols is None else df[[col for col in df.columns if col in usecols]]
+
+
+def value_dtype(value):
+    # dtype for a new column filled with value.
+    text = str(value).strip()
+    if text == "":
+        return "string"
+    for dtype in ("Int64", "float64"):
+        try:
+            coerce_scalar(text, dtype)
+            return dtype
+        except ValueError:
+            pass
+    # The same checks infer_dtype makes when the file is next loaded.
+    if re.fullmatch(_ISO_DATE, text):
+        return "datetime64[ns]"
+    if text.lower() in ("true", "false"):
+        return "boolean"
+    return "category"
+
+
+def coerce_values(values, dtype, column=""):
+    # Converts raw values (usually strings from the agent) to dtype in one
+    # vectorized pass. Blanks become missing values; anything that doesn't
+    # fit raises ValueError naming the first offending value.
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    numeric = pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype)
+    if not pd.api.types.is_object_dtype(values.dtype) and (
+            dtype_name(values) == dtype or (numeric and dtype in ("Int64", "float64"))):
+        # Already the right kind (e.g. int64 or whole floats to Int64): a
+        # plain cast, falling back to parsing if it isn't exact.
+        try:
+            return values.astype(dtype)
+        except (TypeError, ValueError):
+            pass
+    if dtype in ("string", "category"):
+        result = values.astype("string")
+        return result.astype("category") if dtype == "category" else result
+    text = values.astype("string").str.strip()
+    empty = values.isna() | (text == "")
+    text = text.where(~empty)
+    if dtype in ("Int64", "float64"):
+        result = pd.to_numeric(text, errors="coerce")
+        bad = result.isna() & ~empty
+        if dtype == "Int64":
+            bad |= result.notna() & (result % 1 != 0)
+    elif dtype == "boolean":
+        result = text.str.lower().map(_BOOLEANS)
+        bad = result.isna() & ~empty
+    elif dtype.startswith("datetime"):
+        result = pd.to_datetime(text, errors="coerce", format="mixed")
+        bad = result.isna() & ~empty
+    else:
+        return values.astype(dtype)
+    if bad.any():
+        kind = _KINDS.get(dtype, "date")
+        raise ValueError(f"'{values[bad].iloc[0]}' is not a valid {kind} for column '{column}' ({dtype}).")
+    return result.astype(dtype)
+
+
+def coerce_scalar(value, dtype, column=""):
+    # Plain values are converted directly, since a one-element Series costs
+    # far more than the conversion; anything else goes through
+    # coerce_values.
+    if isinstance(value, str) and dtype in _MISSING:
+        text = value.strip()
+        if dtype in ("string", "category"):
+            return value
+        if text == "":
+            return _MISSING[dtype]
+        if dtype == "Int64" and _INTEGER.fullmatch(text):
+            return int(text)
+        if dtype == "float64" and _FLOAT.fullmatch(text):
+            return float(text)
+        if dtype == "boolean" and text.lower() in _BOOLEANS:
+            return _BOOLEANS[text.lower()]
+    elif value is None and dtype in _MISSING:
+        return _MISSING[dtype]
+    return coerce_values(pd.Series([value], dtype=object), dtype, column).iloc[0]
+
+
+def csv_text(value, dtype):
+    # A coerced scalar written the way to_csv writes it. Datetimes depend on
+    # the rest of their column; see date_texts.
+    if pd.isna(value):
+        return ""
+    if dtype == "float64":
+        return repr(float(value))
+    if dtype.startswith("datetime"):
+        return date_texts(pd.Series([value], dtype=dtype), value)[0]
+    return str(value)
+
+
+def _date_details(series):
+    # Per value: 0 for a date at midnight, 1 with a time of day, plus one
+    # for each of milli-, micro- and nanosecond precision it needs; -1 if
+    # missing.
+    within_day = (series - series.dt.normalize()).to_numpy("timedelta64[ns]").astype("int64")
+    detail = (within_day != 0).astype(int) + sum((within_day % unit != 0).astype(int) for unit in (10**9, 10**6, 10**3))
+    detail[series.isna().to_numpy()] = -1
+    return detail
+
+
+def date_detail(value):
+    return int(_date_details(pd.Series([value]))[0])
+
+
+def date_witnesses(df):
+    # to_csv picks one format per datetime column, from the whole column:
+    # date-only if every value is at midnight, otherwise with as many
+    # fractional digits as the most precise value needs. For each datetime
+    # column this returns the value that needs the most detail, so part of
+    # the column can be formatted as if the whole column were there.
+    witnesses = {}
+    for col in df.columns:
+        series = df[col]
+        if not pd.api.types.is_datetime64_any_dtype(series) or not series.notna().any():
+            continue
+        witnesses[col] = series.iloc[int(np.argmax(_date_details(series)))]
+    return witnesses
+
+
+def date_texts(values, witness):
+    # A datetime column's values as to_csv writes them in a column whose
+    # most detailed value is witness. Formatted with the witness in front,
+    # which is then dropped; dates have no commas, quotes or newlines, so
+    # the lines split cleanly.
+    column = pd.concat([pd.Series([witness], dtype=values.dtype), values], ignore_index=True)
+    lines = column.to_csv(index=False, header=False).splitlines()[1:]
+    return ["" if line == '""' else line for line in lines]
+
+
+def assign_values(df, rows, column, values):
+    # df.loc[rows, column] = values, keeping the column's dtype.
+    dtype = dtype_name(df[column])
+    values = coerce_values(values, dtype, column) if isinstance(values, (list, pd.Series)) \
+        else coerce_scalar(values, dtype, column)
+    if dtype == "category":
+        new = pd.Series(values).dropna().unique() if isinstance(values, pd.Series) else [values]
+        new = [value for value in new if not pd.isna(value) and value not in df[column].cat.categories]
+        if new:
+            df[column] = df[column].cat.add_categories(new)
+    df.loc[rows, column] = values.to_numpy() if isinstance(values, pd.Series) else values
+
+
+def concat_rows(df, new):
+    # Appends new rows, converting them to df's dtypes and widening
+    # categories on both sides so categorical columns stay categorical.
+    new = new.reindex(columns=df.columns)
+    for col in df.columns:
+        dtype = dtype_name(df[col])
+        new[col] = coerce_values(new[col], dtype, col)
+        if dtype == "category":
+            categories = df[col].cat.categories.union(new[col].cat.categories)
+            df[col] = df[col].cat.set_categories(categories)
+            new[col] = new[col].cat.set_categories(categories)
+    return pd.concat([df, new], ignore_index=True)
@@ -1,72 +1,212 @@
 from langchain.tools import Tool
-from csvoperations import CSVHandler, parse_kv_string
+from async_ops import run_read, run_write
+from csvoperations import CSVHandler, parse_batch_string, parse_kv_string
+from metrics import timed
+from predicates import split_condition
+from responsecache import writing_tool
 
 
 SYSTEM_PROMPT = """You are an AI CSV assistant that helps users manage their CSV data.
 You can perform the following operations:
-1. View information about the CSV including columns and a preview
+1. View information about the CSV including columns and a preview, or a single row
 2. Remove rows or columns
 3. Add new rows or columns
 4. Set values for specific cells or entire rows
+5. Apply many edits at once with BatchEdit
+6. Update or delete every row matching a condition with UpdateWhere / DeleteWhere
+7. Filter, aggregate, sort and rank data with QueryCSV (read-only)
+8. Undo or redo recent edits with Undo / Redo, and list them with ListHistory
 
 When handling rows, you can use:
 - Specific row numbers (0, 1, 2, etc.)
 - Special values like 'first' or 'last'
+- Conditions such as "country = US and age >= 30" with UpdateWhere / DeleteWhere
 
 When adding columns, you can specify default values.
+When a request touches many rows or needs several edits, send them all in one BatchEdit call
+instead of calling the single-edit tools repeatedly.
 When referring to columns, you can use exact column names.
 
+If the user says an edit was wrong, use Undo rather than trying to recreate the old data.
+Use QueryCSV to answer questions about the data instead of reading rows one by one.
+If several CSVs are open, use ListCSVs and SwitchCSV to pick the one the user means.
 Always analyze the CSV structure first to understand what data you're working with.
 Use the GetCSVInfo tool before performing operations to see available columns and data.
 """
 
+def async_tool(handler, name, func, description, writes=False):
+    # Same tool with a coroutine for ainvoke; writes are serialized per CSV
+    # and keep the turn's answer out of the response cache.
+    run = run_write if writes else run_read
+    func = timed("tool", name, func)
+    if writes:
+        func = writing_tool(handler, func)
+    return Tool.from_function(
+        name=name,
+        func=func,
+        description=description,
+        coroutine=lambda input_str: run(handler, func, input_str),
+    )
+
+
 def create_tools(csv_handler):
     tools = [
-        Tool.from_function(
+        async_tool(
+            csv_handler,
             name="GetCSVInfo",
             func=lambda _: csv_handler.get_csv_info(),
             description="Gets information about the CSV file including column names, number of rows, and a preview."
         ),
 
-        Tool.from_function(
+        async_tool(
+            csv_handler,
+            name="GetRow",
+            func=lambda input_str: csv_handler.get_row(input_str.strip()),
+            description="Shows a single row. Input can be a row index (integer) or special values like 'last' or 'first'."
+        ),
+
+        async_tool(
+            csv_handler,
+            name="QueryCSV",
+            func=lambda input_str: csv_handler.query(input_str.strip()),
+            description=(
+                "Runs a read-only query and returns at most 20 result rows. Input: ';'-separated clauses, all optional: "
+                "'where CONDITION' (same syntax as UpdateWhere), 'columns a, b', 'group by a, b', "
+                "'agg count(*), sum(x), mean(x), min(x), max(x), median(x), nunique(x)', 'sort by col desc', 'limit N'. "
+                "Example: 'where country = US; group by city; agg mean(salary), count(*); sort by mean_salary desc; limit 5'."
+            )
+        ),
+
+        async_tool(
+            csv_handler,
             name="RemoveColumn",
             func=lambda input_str: csv_handler.remove_column(input_str.strip()),
-            description="Removes a column. Input is the column name (string)."
+            description="Removes a column. Input is the column name (string).",
+            writes=True
         ),
 
-        Tool.from_function(
+        async_tool(
+            csv_handler,
             name="RemoveRow",
             func=lambda input_str: csv_handler.remove_row(input_str.strip()),
-            description="Removes a row. Input can be a row index (integer) or special values like 'last' or 'first'."
+            description="Removes a row. Input can be a row index (integer) or special values like 'last' or 'first'.",
+            writes=True
         ),
 
-        Tool.from_function(
+        async_tool(
+            csv_handler,
             name="AddColumn",
             func=lambda input_str: csv_handler.add_column(input_str),
-            description="Adds a new column. Input should be column name with optional default values (e.g., 'salary with values=50000')."
+            description="Adds a new column. Input should be column name with optional default values (e.g., 'salary with values=50000').",
+            writes=True
         ),
 
-        Tool.from_function(
+        async_tool(
+            csv_handler,
             name="AddRow",
             func=lambda input_str: csv_handler.add_row(parse_kv_string(input_str)),
-            description="Adds a new row. Input is key=value pairs like 'name=John, age=30'. Keys must match column names."
+            description="Adds a new row. Input is key=value pairs like 'name=John, age=30'. Keys must match column names.",
+            writes=True
         ),
 
-        Tool.from_function(
+        async_tool(
+            csv_handler,
             name="SetCellValue",
             func=lambda input_str: (
                 lambda parts: csv_handler.set_cell(parts[0].strip(), parts[1].strip(), parts[2].strip())
             )(input_str.split(",", 2)),
-            description="Sets a specific cell. Input: 'row_index/first/last, column_name, value'. Row can be numeric index or 'first'/'last'."
+            description="Sets a specific cell. Input: 'row_index/first/last, column_name, value'. Row can be numeric index or 'first'/'last'.",
+            writes=True
         ),
 
-        Tool.from_function(
+        async_tool(
+            csv_handler,
             name="SetRow",
             func=lambda input_str: (
                 lambda i, kv: csv_handler.set_row(i.strip(), parse_kv_string(kv))
             )(*input_str.split(":", 1)),
-            description="Sets an entire row. Input: 'row_index/first/last: key=value, key2=value2'. Row can be numeric or 'first'/'last'."
+            description="Sets an entire row. Input: 'row_index/first/last: key=value, key2=value2'. Row can be numeric or 'first'/'last'.",
+            writes=True
+        ),
+
+        async_tool(
+            csv_handler,
+            name="UpdateWhere",
+            func=lambda input_str: (
+                lambda condition, kv: csv_handler.update_where(condition, parse_kv_string(kv))
+            )(*split_condition(input_str)),
+            description=(
+                "Sets values in every row matching a condition. Input: 'condition: key=value, key2=value2'. "
+                "Conditions compare columns with =, !=, >, >=, <, <=, 'in (a, b)', 'contains text', 'is empty', "
+                "combined with and/or/not and parentheses, e.g. \"country = US and age >= 30: salary=0\"."
+            ),
+            writes=True
+        ),
+
+        async_tool(
+            csv_handler,
+            name="DeleteWhere",
+            func=lambda input_str: csv_handler.delete_where(input_str.strip()),
+            description="Removes every row matching a condition. Input is a condition like UpdateWhere's, e.g. \"country in (US, CA) or city contains york\".",
+            writes=True
+        ),
+
+        async_tool(
+            csv_handler,
+            name="BatchEdit",
+            func=lambda input_str: csv_handler.apply_batch(parse_batch_string(input_str)),
+            description=(
+                "Applies several edits in one step; all succeed or none are applied. Input: commands separated by ';' or newlines: "
+                "'set ROWS, column, value', 'setrow ROWS: key=value, ...', 'addrow key=value, ...', 'removerow ROWS', "
+                "'addcol name with values=x', 'removecol name'. ROWS is an index, 'first', 'last', a range like '1-500', "
+                "or several joined with '|' like '1|4|7-9'."
+            ),
+            writes=True
+        ),
+
+        async_tool(
+            csv_handler,
+            name="Undo",
+            func=lambda input_str: csv_handler.undo(parse_steps(input_str)),
+            description="Reverts the most recent edits. Input is the number of edits to undo (default 1).",
+            writes=True
+        ),
+
+        async_tool(
+            csv_handler,
+            name="Redo",
+            func=lambda input_str: csv_handler.redo(parse_steps(input_str)),
+            description="Re-applies edits that were just undone. Input is the number of edits to redo (default 1).",
+            writes=True
+        ),
+
+        async_tool(
+            csv_handler,
+            name="ListHistory",
+            func=lambda _: csv_handler.list_history(),
+            description="Lists the edits that can be undone or redone."
         ),
     ]
     
-    return tools 
\ No newline at end of file
+    return tools 
+
+
+def parse_steps(input_str):
+    input_str = str(input_str).strip()
+    return int(input_str) if input_str.isdigit() and int(input_str) > 0 else 1
+
+
+def create_workspace_tools(session):
+    return [
+        Tool.from_function(
+            name="ListCSVs",
+            func=timed("tool", "ListCSVs", lambda _: session.list_csvs()),
+            description="Lists the CSV files available in this session and which one is active."
+        ),
+
+        Tool.from_function(
+            name="SwitchCSV",
+            func=timed("tool", "SwitchCSV", lambda input_str: session.switch(input_str.strip())),
+            description="Makes another CSV the active one; all other tools then work on it. Input is the CSV name from ListCSVs."
+        ),
+    ]
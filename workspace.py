@@ -0,0 +1,183 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from csvoperations import CSVHandler
+from csvstreaming import StreamingCSVHandler
+
+# Files larger than this are edited chunk by chunk instead of being loaded whole.
+STREAMING_THRESHOLD_BYTES = int(os.getenv("CSV_STREAMING_THRESHOLD", 512 * 1024 * 1024))
+DEFAULT_MEMORY_BUDGET = int(os.getenv("CSV_MEMORY_BUDGET", 1024 * 1024 * 1024))
+
+
+def open_handler(csv_path):
+    if os.path.exists(csv_path) and os.path.getsize(csv_path) > STREAMING_THRESHOLD_BYTES:
+        return StreamingCSVHandler(csv_path)
+    return CSVHandler(csv_path, session=True, journal=True, lazy_export=True)
+
+
+def close_handler(handler):
+    # CSVHandler keeps its lock file open; the other handlers hold nothing.
+    close = getattr(handler, "close", None)
+    if close is not None:
+        close()
+
+
+def frame_bytes(handler):
+    # The frame plus the undo deltas the handler keeps next to it.
+    df = getattr(handler, "df", None)
+    history = getattr(handler, "history_bytes", 0)
+    return history if df is None else int(df.memory_usage(index=True, deep=True).sum()) + history
+
+
+class Workspace:
+    # Owns every open handler in the process. Loaded frames are kept in an
+    # LRU bounded by their total in-memory size; when it overflows, the
+    # least recently used ones are flushed to their Feather cache and
+    # dropped, to be reopened from it on next use.
+    #
+    # With a root, each session has a directory under it for files put
+    # there (e.g. uploads); open_handler makes the handler for a path.
+    def __init__(self, root=None, memory_budget=DEFAULT_MEMORY_BUDGET, open_handler=open_handler):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.open_handler = open_handler
+        self._hot = OrderedDict()
+        self._sizes = {}
+        self._unexported = set()
+        self._sessions = {}
+        self._lock = threading.RLock()
+
+    def session(self, session_id):
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", session_id):
+            raise ValueError(f"Invalid session id '{session_id}'.")
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = SessionWorkspace(self, session_id)
+            return self._sessions[session_id]
+
+    def drop_session(self, session_id):
+        # Forgets a session whose files were deleted, without writing back.
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            for path in session.paths.values() if session else []:
+                key = os.path.abspath(path)
+                handler = self._hot.pop(key, None)
+                if handler is not None:
+                    close_handler(handler)
+                self._sizes.pop(key, None)
+                self._unexported.discard(key)
+
+    def handler(self, csv_path):
+        key = os.path.abspath(csv_path)
+        with self._lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                return self._hot[key]
+            handler = self._hot[key] = self.open_handler(csv_path)
+            self._sizes[key] = frame_bytes(handler)
+            self._evict(keep=key)
+            return handler
+
+    def rebalance(self):
+        # Frames grow and shrink as they are edited; re-measure them (at the
+        # end of a turn rather than on every call) and evict if needed.
+        with self._lock:
+            for key, handler in self._hot.items():
+                self._sizes[key] = frame_bytes(handler)
+            if self._hot:
+                self._evict(keep=next(reversed(self._hot)))
+
+    def _evict(self, keep):
+        while sum(self._sizes.values()) > self.memory_budget and len(self._hot) > 1:
+            key = next(iter(self._hot))
+            if key == keep:
+                self._hot.move_to_end(key)
+                continue
+            handler = self._hot.pop(key)
+            self._sizes.pop(key, None)
+            handler.flush()
+            close_handler(handler)
+            # A lazy flush leaves the changes in the Feather cache only, even
+            # when it happened before this point (e.g. a session's flush).
+            if getattr(handler, "unexported", False):
+                self._unexported.add(key)
+
+    def hot_handlers(self, paths=None):
+        with self._lock:
+            keys = [os.path.abspath(path) for path in paths] if paths is not None else list(self._hot)
+            return [self._hot[key] for key in keys if key in self._hot]
+
+    def export(self, paths=None):
+        # Writes the CSVs back, including ones that were evicted while they
+        # only had their changes in the Feather cache. None means every CSV
+        # this workspace has opened.
+        with self._lock:
+            if paths is None:
+                paths = list(self._hot) + sorted(self._unexported - set(self._hot))
+            for path in paths:
+                key = os.path.abspath(path)
+                if key in self._hot or key in self._unexported:
+                    self.handler(path).export_csv()
+                    self._unexported.discard(key)
+
+
+class SessionWorkspace:
+    # One user's set of named CSVs, with one of them active. Anything not
+    # defined here (get_csv_info, set_cell, ...) goes to the active CSV's
+    # handler, so it can be passed to create_tools like a handler.
+    def __init__(self, workspace, session_id):
+        self.workspace = workspace
+        self.session_id = session_id
+        self.directory = os.path.join(workspace.root, session_id) if workspace.root else None
+        self.paths = {}
+        self.active_name = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            for file_name in sorted(os.listdir(self.directory)):
+                if file_name.endswith(".csv"):
+                    self.paths[file_name[:-4]] = os.path.join(self.directory, file_name)
+        if self.paths:
+            self.active_name = next(iter(self.paths))
+
+    def add(self, csv_path, name=None):
+        name = name or os.path.splitext(os.path.basename(csv_path))[0]
+        self.paths[name] = csv_path
+        if self.active_name is None:
+            self.active_name = name
+        return name
+
+    @property
+    def active(self):
+        if self.active_name is None:
+            raise ValueError("No CSV is open in this session.")
+        return self.workspace.handler(self.paths[self.active_name])
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.active, attr)
+
+    def list_csvs(self):
+        if not self.paths:
+            return "No CSVs are open."
+        return "Available CSVs: " + ", ".join(
+            f"{name} (active)" if name == self.active_name else name for name in self.paths
+        )
+
+    def switch(self, name):
+        if name not in self.paths:
+            matches = [known for known in self.paths if name.lower() in known.lower()]
+            if len(matches) != 1:
+                return f"No single CSV named '{name}'. {self.list_csvs()}"
+            name = matches[0]
+        self.active_name = name
+        return f"Switched to '{name}'."
+
+    def flush(self):
+        for handler in self.workspace.hot_handlers(self.paths.values()):
+            handler.flush()
+        self.workspace.rebalance()
+
+    def export_csv(self):
+        self.workspace.export(self.paths.values())